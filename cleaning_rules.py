@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import re
+
+
+class CleaningRules:
+    """
+    Declarative set of cleaning rules for one table. The rules are compiled so that every column is read and written
+    at most once for marking incorrect entries and once for its column rules, and only the columns named by a rule are touched.
+
+    The rules are applied in three passes:
+        1. entries equal to one of null_values or matching a null pattern are marked,
+           all values and patterns for a column are combined in a single regular expression
+        2. rows that DataFrame.dropna() would remove once the marked entries are replaced with nan are removed,
+           the removed rows can be kept with their original entries, and the marked entries of the remaining rows are replaced
+        3. the column rules are applied in order to each column
+
+        Args:
+            null_values (list): entries replaced with nan in every text column, for example 'NULL'
+            null_patterns (dict): regular expressions matched from the start of the entry, keyed by column name.
+                Matching entries are replaced with nan, the '*' key applies a pattern to every text column.
+            dropna (dict): the 'subset' and 'how' arguments of DataFrame.dropna(), rows are not removed if None
+            column_rules (dict): lists of functions taking and returning a pandas series, keyed by column name
+            reject_key (str): key under which the removed rows are stored in the rejected_rows dictionary passed to apply()
+    """
+    def __init__(self, null_values: list = (), null_patterns: dict = None, dropna: dict = None, column_rules: dict = None,
+                 reject_key: str = None) -> None:
+        self.null_values = list(null_values)
+        self.null_patterns = null_patterns or {}
+        self.dropna = dropna
+        self.column_rules = column_rules or {}
+        self.reject_key = reject_key
+
+    def compile_null_patterns(self, df: pd.DataFrame) -> dict:
+        """
+        Combines the null values and null patterns of each text column of the dataframe into one regular expression.
+
+        Args:
+            df (pd.DataFrame): dataframe to be cleaned
+        Returns:
+            dict: compiled regular expressions keyed by column name
+        """
+        text_columns = df.select_dtypes(include=['object', 'string']).columns
+        alternatives = {column: [re.escape(value) + r'\Z' for value in self.null_values] for column in text_columns}
+        for column, pattern in self.null_patterns.items():
+            for target_column in (text_columns if column == '*' else [column]):
+                alternatives.setdefault(target_column, []).append(pattern)
+        return {column: re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+                for column, patterns in alternatives.items() if patterns}
+
+    def apply(self, df: pd.DataFrame, rejected_rows: dict = None) -> pd.DataFrame:
+        """
+        Cleans the dataframe with the compiled rules.
+
+        Args:
+            df (pd.DataFrame): dataframe to be cleaned
+            rejected_rows (dict): if passed, the removed rows are stored in it under reject_key
+        Returns:
+            df (pd.DataFrame): the cleaned dataframe
+        """
+        null_masks = {}
+        for column, pattern in self.compile_null_patterns(df).items():
+            try:
+                null_mask = df[column].str.match(pattern, na=False).astype(bool)
+            except AttributeError:
+                # object columns without any strings cannot contain the null values or match the patterns
+                continue
+            if null_mask.any():
+                null_masks[column] = null_mask
+
+        if self.dropna is not None:
+            not_null = df[self.dropna.get('subset', df.columns)].notna()
+            for column in not_null.columns.intersection(list(null_masks)):
+                not_null[column] &= ~null_masks[column]
+            keep_mask = not_null.any(axis=1) if self.dropna.get('how', 'any') == 'all' else not_null.all(axis=1)
+            if rejected_rows is not None and self.reject_key:
+                rejected_rows[self.reject_key] = df[~keep_mask]
+            df = df[keep_mask].copy(deep=False)
+            null_masks = {column: null_mask[keep_mask] for column, null_mask in null_masks.items()}
+
+        for column, null_mask in null_masks.items():
+            df[column] = df[column].mask(null_mask, np.nan)
+
+        for column, rules in self.column_rules.items():
+            series = df[column]
+            for rule in rules:
+                series = rule(series)
+            df[column] = series
+        return df
+
+
+def as_type(dtype):
+    """
+    Rule converting a column to the passed data type.
+    """
+    return lambda series: series.astype(dtype, errors='raise')
+
+
+def replace_text(old: str, new: str):
+    """
+    Rule replacing every occurrence of a substring (not a regular expression) in a column.
+    """
+    return lambda series: series.str.replace(old, new, regex=False)
+
+
+def null_unless_contains(text: str):
+    """
+    Rule replacing entries that do not contain the passed substring with nan.
+    """
+    return lambda series: series.where(series.str.contains(text, regex=False, na=True).astype(bool))
+
+
+def add_offset(offset):
+    """
+    Rule adding a date offset, for example MonthEnd(1), to a datetime column.
+    """
+    return lambda series: series + offset
+
+
+def to_dates(formats: list = (), mixed_fallback: bool = True, as_date: bool = False):
+    """
+    Rule parsing a column to datetime. The known formats are tried first, each on the entries that are still unparsed,
+    and only the remaining entries are parsed with the slow format='mixed' parser. Entries that cannot be parsed become NaT.
+
+    Args:
+        formats (list): strftime formats tried in order
+        mixed_fallback (bool): parses the remaining entries with format='mixed'
+        as_date (bool): returns python date objects instead of datetime64 values
+    """
+    def rule(series: pd.Series) -> pd.Series:
+        parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+        unparsed = series.notna()
+        for date_format in list(formats) + (['mixed'] if mixed_fallback else []):
+            if not unparsed.any():
+                break
+            parsed[unparsed] = pd.to_datetime(series[unparsed], format=date_format, errors='coerce')
+            unparsed &= parsed.isna()
+        return parsed.dt.date if as_date else parsed
+    return rule
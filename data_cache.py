@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+
+class DataCache:
+    """
+    Local cache for dataframes extracted from remote sources. Entries are keyed on the source address and its version
+    (for example an ETag or Last-Modified header), so a changed source is downloaded again while an unchanged one is read
+    from disk. Dataframes are stored as Parquet files, falling back to pickle for columns Parquet cannot store.
+    Entries expire after the time to live and the least recently used entries are removed when the cache exceeds its size.
+
+        Args:
+            cache_dir (str): directory in which the cached files are stored
+            ttl (float): number of seconds after which an entry expires, entries do not expire if None
+            max_size (int): maximum total size of the cached files in bytes
+    """
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir: str = '.cache', ttl: float = None, max_size: int = 2 * 1024 ** 3) -> None:
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._read_index()
+
+    def make_key(self, source: str, version: str = None) -> str:
+        """
+        Creates the cache key for a version of a source.
+
+        Args:
+            source (str): address of the source, for example a URL
+            version (str): version of the source, for example an ETag
+        Returns:
+            str: hex digest identifying the entry
+        """
+        return hashlib.sha256(f'{source}|{version}'.encode()).hexdigest()
+
+    def get(self, source: str, version: str = None) -> pd.DataFrame:
+        """
+        Returns the cached dataframe for a version of a source.
+
+        Args:
+            source (str): address of the source
+            version (str): version of the source
+        Returns:
+            pd.DataFrame: the cached dataframe, None if it is not cached or has expired
+        """
+        key = self.make_key(source, version)
+        with self._lock:
+            entry = self.index.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry['created'] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            entry['last_access'] = time.time()
+            self._write_index()
+        path = os.path.join(self.cache_dir, entry['file'])
+        if entry['file'].endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    def put(self, source: str, version: str, df: pd.DataFrame) -> None:
+        """
+        Stores a dataframe for a version of a source, replacing entries for older versions of the same source.
+
+        Args:
+            source (str): address of the source
+            version (str): version of the source
+            df (pd.DataFrame): dataframe to store
+        """
+        key = self.make_key(source, version)
+        path = os.path.join(self.cache_dir, f'{key}.parquet')
+        try:
+            df.to_parquet(path)
+        except (TypeError, ValueError, ImportError, ArithmeticError):
+            # columns with mixed types cannot be stored in Parquet
+            if os.path.exists(path):
+                os.remove(path)
+            path = os.path.join(self.cache_dir, f'{key}.pkl')
+            df.to_pickle(path)
+
+        with self._lock:
+            for old_key in [old_key for old_key, entry in self.index.items() if entry['source'] == source]:
+                self._remove(old_key)
+            now = time.time()
+            self.index[key] = {'source': source, 'version': version, 'file': os.path.basename(path),
+                               'size': os.path.getsize(path), 'created': now, 'last_access': now}
+            self._evict()
+            self._write_index()
+
+    def get_or_load(self, source: str, version: str, load_function) -> pd.DataFrame:
+        """
+        Returns the cached dataframe for a version of a source, or loads it with the passed function and caches it.
+
+        Args:
+            source (str): address of the source
+            version (str): version of the source
+            load_function (callable): function without arguments returning the dataframe from the source
+        Returns:
+            pd.DataFrame: the cached or loaded dataframe
+        """
+        df = self.get(source, version)
+        if df is None:
+            df = load_function()
+            self.put(source, version, df)
+        return df
+
+    def _evict(self) -> None:
+        """
+        Removes the least recently used entries until the total size of the cache is below max_size.
+        """
+        total_size = sum(entry['size'] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda key: self.index[key]['last_access']):
+            if total_size <= self.max_size:
+                break
+            total_size -= self.index[key]['size']
+            self._remove(key)
+            self.stats['evictions'] += 1
+
+    def _remove(self, key: str) -> None:
+        """
+        Removes an entry and its file from the cache.
+        """
+        entry = self.index.pop(key)
+        path = os.path.join(self.cache_dir, entry['file'])
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _read_index(self) -> dict:
+        """
+        Reads the index of cached entries from the cache directory.
+        """
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.isfile(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write_index(self) -> None:
+        """
+        Writes the index of cached entries to the cache directory, replacing the previous file in one step.
+        """
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.index, f)
+        os.replace(path + '.tmp', path)
@@ -1,77 +1,84 @@
+from cleaning_rules import CleaningRules, add_offset, as_type, null_unless_contains, replace_text, to_dates
+from instrumentation import instrumented
 from pandas.tseries.offsets import MonthEnd
-import numpy as np
 import pandas as pd
 
 
+@instrumented
 class DataCleaning:
+    """
+    Cleans the data extracted from each of the data sources.
+    Rows removed because of incorrect entries are kept in the rejected_rows dictionary, keyed by the name of the cleaned column.
+    """
+    # conversion factors from each unit of weight to kilograms, mililitres are treated as grams
+    WEIGHT_UNITS = {'kg': 1.0, 'g': 0.001, 'ml': 0.001, 'oz': 0.02835}
+
+    # lower bounds in kilograms of the weight_class buckets added to dim_products by the Task 4 script
+    WEIGHT_CLASSES = {'Light': float('-inf'), 'Mid_Sized': 2, 'Heavy': 40, 'Truck_Required': 140}
+
+    USER_DATA_RULES = CleaningRules(
+        null_values=['NULL'],
+        # incorrect entries containing 10 alphanumeric uppercase characters
+        null_patterns={'*': '[A-Z0-9]{10}'},
+        # removes entire rows with missing data by indexing the 'user_uuid' column
+        dropna={'subset': ['user_uuid'], 'how': 'all'},
+        column_rules={
+            'date_of_birth': [to_dates(['%Y-%m-%d'], as_date=True)],
+            'email_address': [as_type('string'), replace_text('@@', '@'), null_unless_contains('@')],
+            'join_date': [to_dates(['%Y-%m-%d'], as_date=True)],
+            'country_code': [replace_text('GGB', 'GB'), as_type('category')],
+            'address': [replace_text('\n', ' '), as_type('string')],
+            'first_name': [as_type('string')],
+            'last_name': [as_type('string')],
+            'company': [as_type('string')],
+            'country': [as_type('string')],
+            'phone_number': [as_type('string')],
+            'user_uuid': [as_type('string')],
+        },
+        reject_key='user_uuid')
+
+    CARD_DATA_RULES = CleaningRules(
+        null_values=['NULL'],
+        # non numeric entries in the "card_number" column
+        null_patterns={'card_number': '[a-zA-Z]'},
+        dropna={},
+        column_rules={
+            'card_number': [as_type('string'), replace_text('?', '')],
+            # converts the "expiry_date" column to datetime infering last day for each month
+            'expiry_date': [to_dates(['%m/%y'], mixed_fallback=False), add_offset(MonthEnd(1))],
+            'date_payment_confirmed': [to_dates(['%Y-%m-%d'])],
+            'card_provider': [as_type('category')],
+        },
+        reject_key='card_number')
+
+    def __init__(self) -> None:
+        self.rejected_rows = {}
+
     def clean_user_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Takes in a pandas dataframe containg user data from the project database and cleans it.
         Operations involve removing incorrect entries, parsing data types, correcting some entries containing extra characters.
+        The operations are declared in USER_DATA_RULES.
 
         Args:
             df (pd.DataFrame): pandas dataframe with user data
         Returns:
             df (pd.DataFrame): pandas dataframe with clean user data
         """
-        df.replace(to_replace='NULL', value=np.nan, inplace=True)
-
-        # replaces all incorrect entries containing 10 alphanumeric uppercase characters with nan
-        df.replace(to_replace='^[A-Z0-9]{10}',regex=True, value=np.nan, inplace=True) 
-
-        df['date_of_birth'] = pd.to_datetime(df['date_of_birth'], format='mixed', errors='coerce').dt.date
-
-        df['email_address'] = df['email_address'].astype('string', errors='raise')
-
-        df['email_address'] = df['email_address'].str.replace('@@','@')
-
-        df.loc[~df['email_address'].str.contains('@'), 'email_address'] = np.nan
-
-        df['join_date'] = pd.to_datetime(df['join_date'], format='mixed', errors='coerce').dt.date
-
-        df['country_code'] = df['country_code'].str.replace('GGB','GB')
-
-        df['address'] = df['address'].str.replace('\n',' ')
-
-        column_list = ['first_name', 'last_name', 'company', 'address','country', 'phone_number', 'user_uuid'] 
-        df[column_list] = df[column_list].astype('string', errors='raise')
-
-        df['country_code'] = df['country_code'].astype('category', errors='raise') 
-
-        # removes entire rows with missing data by indexing the 'user_uuid' column
-        df.dropna(subset= ['user_uuid'], how='all', inplace=True)
-
-        return df
+        return self.USER_DATA_RULES.apply(df, self.rejected_rows)
     
     def clean_card_data(self, df:pd.DataFrame) -> pd.DataFrame:   
         """
         Takes in a pandas dataframe containg card details from the project database and cleans it.
         Operations involve removing incorrect entries, parsing data types, correcting some entries containing invalid characters.
+        The operations are declared in CARD_DATA_RULES.
         
         Args:
             df (pd.DataFrame): pandas dataframe with card details data
         Returns:
             df (pd.DataFrame): pandas dataframe with clean card details data
         """
-        df.replace(to_replace='NULL', value=np.nan, inplace=True)
-
-        # replaces all non numeric entries in the "card_number" column with nan
-        df['card_number'].replace(to_replace='^[a-zA-Z]',regex=True, value=np.nan, inplace=True)
-
-        df.dropna(inplace=True)
-
-        df['card_number'] = df['card_number'].astype('string', errors='raise')
-
-        df['card_number'] = df['card_number'].str.replace('?','')
-        
-        # converts the "expiry_date" column to datetime infering last day for each month
-        df['expiry_date'] = pd.to_datetime(df['expiry_date'], format='%m/%y', errors='coerce') + MonthEnd(1)
-
-        pd.to_datetime(df['date_payment_confirmed'], errors='coerce')
-
-        df['card_provider'].astype('category')
-        
-        return df
+        return self.CARD_DATA_RULES.apply(df, self.rejected_rows)
     
     def clean_store_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -90,6 +97,7 @@ class DataCleaning:
         
         # removes all rows with incorrect entries by filtering the 'country_code' column to length of 10, inluding NaNs
         mask = df['country_code'].str.contains('^.{10}', regex=True, na=True)
+        self.rejected_rows['country_code'] = df[mask]
         df = df[~mask]
         
         # corrects some entries in the "staff numbers" column, contained a mix of numbers and characters
@@ -97,6 +105,9 @@ class DataCleaning:
         df['staff_numbers'] = pd.to_numeric(df['staff_numbers'], errors='raise')
         
         df['opening_date'] = pd.to_datetime(df['opening_date'], format='mixed', errors='coerce')
+
+        # converts the coordinates to numbers (FLOAT in Task 3), the "N/A" entries of the web store become missing values
+        df[['longitude', 'latitude']] = df[['longitude', 'latitude']].apply(pd.to_numeric, errors='coerce')
         
         # removes additional 'ee' characters in some "continent" column entries
         df['continent'].replace(to_replace='eeEurope', value='Europe', inplace=True)
@@ -109,46 +120,34 @@ class DataCleaning:
     def convert_product_weights(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Takes in a dataframe containing product data and cleans all the entries in the "weight" column.
-        Units are unified to kilograms. Fields containing multiplications are first calculated and the converted to kg.
-        Erroneous entries are removed.
+        Units are unified to kilograms. The quantity (for multipacks such as "12 x 100g"), value and unit of every entry are
+        extracted with a single regular expression and converted to kilograms using the WEIGHT_UNITS lookup table.
+        Entries that do not match the expected format are removed and kept in the rejected_rows dictionary.
 
         Args:
             df (pd.DataFrame): pandas dataframe with products data to clean
         Returns:
             pd.DataFrame: pandas dataframe with clean weight column 
         """
-        # removes all null values from the dataframe
-        df.dropna(inplace=True)
-        
-        # filters the weight column for any entries containing multiplications or "x" and replaces with "*" which is accepted by pd.eval()
-        # removes "g" from all filtered entries
-
-        df.loc[df['weight'].str.contains('x'), 'weight'] = df.loc[df['weight'].str.contains('x'), 'weight'].replace(to_replace='g', value='', regex=True)
-        df.loc[df['weight'].str.contains('x'), 'weight'] = df.loc[df['weight'].str.contains('x'), 'weight'].replace(to_replace='x', value='*', regex=True)
-        
-        # Uses pd.eval() on the cleaned entries to calculate the weights and converts to kilograms.
-        df.loc[df['weight'].str.contains('\*'), 'weight'] = df.loc[df['weight'].str.contains('\*'), 'weight'].apply(lambda x : pd.eval(x)/1000)
-        
-        df['weight'].replace(to_replace='kg', value='', regex=True, inplace=True)
-        
-        df['weight'].replace(to_replace='ml', value='g', regex=True, inplace=True)
+        # rows with null values are removed together with the incorrect weights
+        null_mask = df.isna().any(axis=1)
 
-        # filters all rows containing the character 'g', removes it and converts entries to kilograms
-        mask_g = df['weight'].str.contains('g', na=False)
-        df.loc[mask_g, 'weight'] = df.loc[mask_g, 'weight'].replace(to_replace='g', value='', regex=True).apply(lambda x : pd.eval(x)/1000 if str(x).isdigit() else x)
+        # extracts quantity, value and unit in one pass, for example "12 x 100g" -> ("12", "100", "g") and "77g ." -> (nan, "77", "g")
+        weight_parts = df['weight'].str.extract(r'^\s*(?:(?P<quantity>\d+(?:\.\d+)?)\s*x\s*)?(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>kg|g|ml|oz)\s*\.?\s*$')
 
-        # removes rows with incorrect alphanumerical data of length 10
-        error_indexes = df[df['weight'].str.contains('^.{10}', regex=True, na=False)].index
-        df = df.drop(error_indexes, axis=0)
+        quantity = weight_parts['quantity'].astype(float).fillna(1)
+        unit_to_kg = weight_parts['unit'].map(self.WEIGHT_UNITS)
+        weight = quantity * weight_parts['value'].astype(float) * unit_to_kg
 
-        df['weight'].replace(to_replace='77 .', value=0.077, regex=True, inplace=True)
+        # rows with incorrect entries, for example alphanumerical data of length 10, are kept for inspection and removed
+        rejected_mask = weight.isna() | null_mask
+        self.rejected_rows['weight'] = df[rejected_mask]
+        if rejected_mask.any():
+            print(f'{rejected_mask.sum()} rows with missing or incorrect weights have been removed.')
 
-        # converts entries containing ounces into kilograms
-        mask_oz = df['weight'].str.contains('oz', na=False)
-        df.loc[mask_oz, 'weight'] = df.loc[mask_oz, 'weight'].replace(to_replace='oz', value='', regex=True).apply(lambda x : pd.eval(x)*28.35/1000)
+        df = df[~rejected_mask].copy()
+        df['weight'] = weight[~rejected_mask]
 
-        df['weight'] = df['weight'].astype(float)
-        
         return df
     
     def clean_products_data(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -172,6 +171,29 @@ class DataCleaning:
         
         return df
     
+    def match_products_schema(self, df: pd.DataFrame, table_columns: list) -> pd.DataFrame:
+        """
+        Applies the value changes of the Task 4 and Task 5 scripts to cleaned products data, if they have been run on the
+        dim_products table, so that the rows can be upserted into it: the "weight_class" column is added from the weight
+        buckets and the "removed" column is replaced by the boolean "still_available" column.
+
+        Args:
+            df (pd.DataFrame): pandas dataframe with clean products data
+            table_columns (list): column names of the dim_products table
+        Returns:
+            pd.DataFrame: pandas dataframe with the columns of the dim_products table
+        """
+        if 'weight_class' in table_columns and 'weight_class' not in df.columns:
+            bounds = list(self.WEIGHT_CLASSES.values()) + [float('inf')]
+            weight_class = pd.cut(df['weight'], bounds, right=False, labels=list(self.WEIGHT_CLASSES))
+            df['weight_class'] = weight_class.astype(object).where(weight_class.notna(), None)
+
+        if 'still_available' in table_columns and 'removed' in df.columns:
+            df['removed'] = df['removed'] != 'Removed'
+            df = df.rename(columns={'removed': 'still_available'})
+
+        return df
+
     def clean_orders_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Takes is a pandas dataframe containing orders data, cleans it and returns.
@@ -189,25 +211,38 @@ class DataCleaning:
     def clean_date_times(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Takes is a pandas dataframe containing date and time data, cleans it and returns.
+        The "date_time" column is assembled directly from the numeric year, month and day columns and the time of day,
+        without building and parsing strings. An iterable of dataframes (for example a chunked json reader) can be passed
+        instead of a dataframe, the chunks are cleaned one at a time and concatenated.
         
         Args:
-            df (pd.DataFrame): pandas dataframe with date and time data to clean
+            df (pd.DataFrame): pandas dataframe with date and time data to clean, or an iterable of dataframes
         Returns:
             df (pd.DataFrame): pandas dataframe with clean date and time data 
         """
-        # removes all incorrect values from the 'timestamp' column, specifically all entries that do not contain a colon
-        df.drop(df[~df['timestamp'].str.contains(':')].index, inplace=True)
-
-        # adds a column with datetime objects, created from columns: 'day', 'month', 'year' and 'timestap'
-        df['date_time'] = df['year'] + '/' + df['month'] + '/' + df['day'] + ' ' + df['timestamp']
-        df['date_time'] = pd.to_datetime(df['date_time'], format='ISO8601', errors='raise')
-
-        # removes redundant columns
-        df.drop(columns=['timestamp', 'month', 'year', 'day'], inplace=True)
-
-        df['time_period'] = df['time_period'].astype('category')
+        if not isinstance(df, pd.DataFrame):
+            chunks, rejected_chunks = [], []
+            for chunk in df:
+                chunks.append(self.clean_date_times(chunk))
+                rejected_chunks.append(self.rejected_rows['timestamp'])
+            df = pd.concat(chunks)
+            self.rejected_rows['timestamp'] = pd.concat(rejected_chunks)
+            df['time_period'] = df['time_period'].astype('category')
+            return df
+
+        # filters out all incorrect values from the 'timestamp' column, specifically all entries that do not contain a colon
+        mask = df['timestamp'].str.contains(':', regex=False, na=False)
+        self.rejected_rows['timestamp'] = df[~mask]
+
+        # creates datetime values from columns: 'day', 'month', 'year' and 'timestamp'
+        date_parts = {part: pd.to_numeric(df.loc[mask, part], errors='raise') for part in ['year', 'month', 'day']}
+        date_time = pd.to_datetime(date_parts, errors='raise') + pd.to_timedelta(df.loc[mask, 'timestamp'], errors='raise')
+
+        # only the needed columns of the valid rows are copied to the clean dataframe
+        df = pd.DataFrame({
+            'date_time': date_time,
+            'time_period': df.loc[mask, 'time_period'].astype('category'),
+            'date_uuid': df.loc[mask, 'date_uuid'],
+        })
         
-        # rearrange columns
-        df = df[['date_time','time_period', 'date_uuid']]
-        
-        return df
\ No newline at end of file
+        return df
@@ -1,14 +1,80 @@
+from boto3.s3.transfer import TransferConfig
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from data_cache import DataCache
 from database_utils import DatabaseConnector
+from instrumentation import instrumented
+from io import BytesIO
+from requests.adapters import HTTPAdapter
 from sqlalchemy import text
+from pypdf import PdfReader
+from stores_crawler import CrawlCheckpoint, RateLimitedRetry, StoresCrawler, TokenBucket
+from typing import Iterator
 import boto3
-import os.path
-import re
+import fnmatch
+import multiprocessing
+import os
 import requests
 import tabula
+import tempfile
+import threading
 import pandas as pd 
 
 
+def read_pdf_pages(path: str, pages: list) -> list:
+    """
+    Extracts the tables from the passed pages of a local pdf file. Used by the worker processes of
+    DataExtractor.retrieve_pdf_data(), each worker keeps its own JVM running between calls (tabula's jpype mode).
+
+    Args:
+        path (str): path of the pdf file
+        pages (list): numbers of the pages to extract, starting from 1
+    Returns:
+        list: dataframes extracted from the pages, in page order
+    """
+    return tabula.read_pdf(path, pages=pages)
+
+
+@instrumented
 class DataExtractor:
+    """
+    Extracts data from the remote data sources.
+
+        Args:
+            cache (DataCache): optional local cache, remote files and API data are read from it when the source has not changed
+            stores_checkpoint (CrawlCheckpoint): optional durable record of the fetched stores, used to resume the stores crawl
+    """
+    # objects over 8 MB are downloaded in concurrent ranged requests of 8 MB
+    S3_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 ** 2, multipart_chunksize=8 * 1024 ** 2, max_concurrency=8)
+
+    def __init__(self, cache: DataCache = None, stores_checkpoint: CrawlCheckpoint = None) -> None:
+        self.cache = cache
+        self.stores_checkpoint = stores_checkpoint
+        self._s3 = None
+        self._s3_client_lock = threading.Lock()
+
+    def _cached(self, source: str, version: str, load_function) -> pd.DataFrame:
+        """
+        Returns the dataframe for a version of a source from the cache, or loads it if there is no cache or the entry is missing.
+        """
+        if self.cache is None:
+            return load_function()
+        return self.cache.get_or_load(source, version, load_function)
+
+    def get_http_version(self, url: str) -> str:
+        """
+        Retrieves the version of a remote file from the ETag or Last-Modified header, without downloading the file.
+
+        Args:
+            url (str): address of the file
+        Returns:
+            str: the version of the file, None if the server does not report one
+        """
+        if self.cache is None or not url.startswith(('http://', 'https://')):
+            return None
+        response = requests.head(url, allow_redirects=True)
+        return response.headers.get('ETag') or response.headers.get('Last-Modified')
+
     def query_db(self,db_connector_instance: DatabaseConnector, query: str):
         """
         Uses an instance of the DatabaseConnector class to establish a connection to the database.
@@ -18,11 +84,13 @@ class DataExtractor:
             db_connector_instance (DatabaseConnector): an instance of the DatabaseConnector class
             query (str): a query to be executed on the database
         Returns:
-            result (ResultProxy): query result
+            result (Result): query result with all rows fetched before the connection is closed, the column names
+                are available from result.keys()
         """
         db_engine = db_connector_instance.init_db_engine()
         with db_engine.execution_options(isolation_level='AUTOCOMMIT').connect() as conn:
-            result = conn.execute(text(query))
+            # freezing buffers all rows, calling the frozen result returns a result that no longer needs the connection
+            result = conn.execute(text(query)).freeze()()
         return result
     
     def read_rds_table(self, db_connector_instance: DatabaseConnector, table_name:str) -> pd.DataFrame:
@@ -34,28 +102,123 @@ class DataExtractor:
             table_name (str): the name of the table from which to extract data
         Returns:
             df (pd.Dataframe): a dataframe containing all the data from the specified table
+        Raises:
+            ValueError: if the table does not exist
         """
-        if table_name in db_connector_instance.list_db_tables():
-            query = f"SELECT * FROM {table_name}"
-            query_result = self.query_db(db_connector_instance, query)
-            df = pd.DataFrame(query_result)
-            return df
-        else:
-            print("The table specified does not exist.")
+        if table_name not in db_connector_instance.list_db_tables():
+            raise ValueError(f'The table {table_name} does not exist.')
+        query = f"SELECT * FROM {table_name}"
+        query_result = self.query_db(db_connector_instance, query)
+        # the column names are passed explicitly, so the columns keep the order of the table (also when it is empty)
+        df = pd.DataFrame(query_result.all(), columns=list(query_result.keys()))
+        return df
+
+    def stream_rds_table(self, db_connector_instance: DatabaseConnector, table_name: str, chunk_size: int = 50000,
+                         dtype: dict = None, key_column: str = None, after=None) -> Iterator[pd.DataFrame]:
+        """
+        Extracts all data from the passed table (if it exists) in chunks, using a server-side cursor so that only one chunk
+        is held in memory at a time. Each chunk can be cleaned and uploaded before the next one is fetched.
+        When a key column is passed, rows are returned in the order of the key and only rows with a key greater than
+        the "after" value are extracted, which allows loading only the rows added since the previous run.
+
+        Args:
+            db_connector_instance (DatabaseConnector): an instance of the DatabaseConnector class
+            table_name (str): the name of the table from which to extract data
+            chunk_size (int): the number of rows in each chunk
+            dtype (dict): optional mapping of column names to data types, keeps the types consistent between chunks
+            key_column (str): optional column used to order the rows and filter out rows already extracted
+            after: the last key value extracted previously, all rows are extracted if it is None
+        Returns:
+            Iterator[pd.DataFrame]: an iterator of dataframes, each containing the next chunk of rows from the specified table
+        Raises:
+            ValueError: if the table does not exist, raised when the method is called rather than on the first chunk
+        """
+        if table_name not in db_connector_instance.list_db_tables():
+            raise ValueError(f'The table {table_name} does not exist.')
+
+        def read_chunks() -> Iterator[pd.DataFrame]:
+            db_engine = db_connector_instance.init_db_engine()
+            with db_engine.connect().execution_options(stream_results=True, yield_per=chunk_size) as conn:
+                query = f"SELECT * FROM {table_name}"
+                params = {}
+                if key_column is not None:
+                    if after is not None:
+                        query += f' WHERE "{key_column}" > :after'
+                        params['after'] = after
+                    query += f' ORDER BY "{key_column}"'
+                yield from pd.read_sql_query(text(query), conn, params=params, chunksize=chunk_size, dtype=dtype)
+
+        return read_chunks()
     
-    def retrieve_pdf_data(self, dir:str) -> pd.DataFrame:
+    def retrieve_pdf_data(self, dir:str, max_workers: int = 1) -> pd.DataFrame:
         """
         Uses the tabula library to extract data from a pdf file to a pandas dataframe.
         The index is not reset on each page, instead it is continuous.
+        With more than one worker the file is downloaded once and its pages are split in contiguous ranges between
+        worker processes, the results are concatenated in page order.
         
         Args:
             dir (str): directory of the pdf file, can be remote
+            max_workers (int): number of worker processes extracting pages at the same time
         Returns:
             concat_df (pd.Dataframe): all pages of the pdf file concatenated to one dataframe
         """
-        list_of_dfs = tabula.read_pdf(dir, pages='all')
-        concat_df = pd.concat(list_of_dfs, ignore_index=True)
+        def read_pdf() -> pd.DataFrame:
+            if max_workers > 1:
+                list_of_dfs = self._read_pdf_in_parallel(dir, max_workers)
+            else:
+                list_of_dfs = tabula.read_pdf(dir, pages='all')
+            return pd.concat(list_of_dfs, ignore_index=True)
+
+        concat_df = self._cached(dir, self.get_http_version(dir), read_pdf)
         return concat_df
+
+    def _read_pdf_in_parallel(self, dir: str, max_workers: int) -> list:
+        """
+        Downloads a remote pdf file to a temporary file and extracts its pages on a pool of worker processes.
+        """
+        is_remote = dir.startswith(('http://', 'https://'))
+        if is_remote:
+            response = requests.get(dir)
+            response.raise_for_status()
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+                f.write(response.content)
+            path = f.name
+        else:
+            path = dir
+
+        try:
+            number_of_pages = len(PdfReader(path).pages)
+            page_numbers = list(range(1, number_of_pages + 1))
+            range_size = -(-number_of_pages // max_workers)
+            page_ranges = [page_numbers[i:i + range_size] for i in range(0, number_of_pages, range_size)]
+            # Workers are spawned, forking a process with running threads (the JVM, thread pools) can deadlock the child.
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = executor.map(read_pdf_pages, [path] * len(page_ranges), page_ranges)
+                list_of_dfs = [df for page_range_dfs in results for df in page_range_dfs]
+        finally:
+            if is_remote:
+                os.remove(path)
+        return list_of_dfs
+
+    def retrieve_json_data(self, url: str, chunk_size: int = None):
+        """
+        Extracts data from a json file to a pandas dataframe. If a chunk size is passed, the file has to contain one json
+        record per line and it is streamed in chunks instead of being parsed at once. Chunks are not cached.
+
+        Args:
+            url (str): address of the json file, can be remote
+            chunk_size (int): optional number of records in each chunk
+        Returns:
+            df (pd.DataFrame): dataframe created from the json file, or an iterator of dataframes if chunk_size is passed
+        """
+        if chunk_size is not None:
+            def read_chunks() -> Iterator[pd.DataFrame]:
+                with pd.read_json(url, lines=True, chunksize=chunk_size) as reader:
+                    yield from reader
+            return read_chunks()
+        df = self._cached(url, self.get_http_version(url), lambda: pd.read_json(url))
+        return df
     
     def list_number_of_stores(self, no_stores_endpoint: str, header_dict: dict) -> int:
         
@@ -72,65 +235,186 @@ class DataExtractor:
         data = response.json()
         return data['number_stores']
     
-    def retrieve_stores_data(self, stores_data_endpoint: str, no_of_stores: int,  header_dict: dict) -> pd.DataFrame:
+    def create_api_session(self, header_dict: dict, pool_size: int = 10, retries: int = 5, backoff_factor: float = 0.5,
+                           rate_limiter: TokenBucket = None) -> requests.Session:
         """
-        Retrieves data for all stores using an API. Converts each store data point to a dataframe and stores in a list.
-        The list of dataframes is concatenated to one dataframe and saved to a CSV file before it is returned. The process of
-        collecting all store data is time consuming and therefore it is more convenient to keep the data localy for further processing.       
-        
+        Creates a requests session with keep-alive connections shared between all requests made through it.
+        Requests are retried with an exponential backoff when the API responds with 429 or a 5xx status code.
+
+        Args:
+            header_dict (dict): dictionary containing the authorization header with the x-api-key
+            pool_size (int): maximum number of connections kept open to the API host
+            retries (int): maximum number of retries for a single request
+            backoff_factor (float): base of the exponential delay between retries in seconds
+            rate_limiter (TokenBucket): token bucket limiting the first attempts, every retry also takes a token from it
+        Returns:
+            session (requests.Session): a session with the headers and retry policy applied
+        """
+        retry = RateLimitedRetry(total=retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504],
+                                 allowed_methods=['GET'], respect_retry_after_header=True, rate_limiter=rate_limiter)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.headers.update(header_dict)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def retrieve_store_details(self, session: requests.Session, stores_data_endpoint: str, store_number: int) -> dict:
+        """
+        Retrieves the data for a single store using an existing API session.
+
+        Args:
+            session (requests.Session): session created with the create_api_session() method
+            stores_data_endpoint (str): the endpoint URL for retrieving store data
+            store_number (int): the number of the store to retrieve
+        Returns:
+            dict: store data as returned by the API
+        """
+        response = session.get(stores_data_endpoint + str(store_number))
+        response.raise_for_status()
+        return response.json()
+
+    def retrieve_stores_data(self, stores_data_endpoint: str, no_of_stores: int,  header_dict: dict, max_workers: int = 16,
+                             requests_per_second: float = None) -> pd.DataFrame:
+        """
+        Retrieves data for all stores using an API. Requests are sent concurrently over one shared session by a StoresCrawler,
+        which records every fetched store in the stores checkpoint (if the extractor has one), so that a failed crawl resumes
+        with the missing stores and only new or stale stores are fetched when the number of stores changes.
+        The dataframe is kept in the cache (if the extractor has one) under the endpoint and number of stores, so that the data
+        can be kept localy for further processing.
+
         Args:
             stores_data_endpoint (str): the endpoint URL for retrieving store data
             no_of_stores (int): the total number of stores to extract
             header_dict (dict): dictionary containing the authorization header with the x-api-key
+            max_workers (int): maximum number of concurrent requests sent to the API
+            requests_per_second (float): maximum rate of requests (including retries) matching the API quota, the rate is
+                not limited if None
         Returns:
             df (pd.Dataframe): a dataframe containing combined data for all stores
         """
-        # Checks if the file "df_stores.csv" has already been downloaded and exists in the local directory to avoid repeated downloads.
-        if os.path.isfile('df_stores.csv'):
-            with open('df_stores.csv', 'r') as f:
-                df_store_data = pd.read_csv(f, index_col='index')
-                f.close()
-        else:
-            # Retrieves the dataframe from the API for each store and adds to list - takes long to complete.
-            df_list = []
-            for store_number in range(0, no_of_stores):
-                stores_data_endpoint_n = stores_data_endpoint +str(store_number)
-                response = requests.get(stores_data_endpoint_n, headers=header_dict)
-                data = response.json()
-                df = pd.DataFrame([data])
-                df_list.append(df)
-                
-            # Concatenates the list of dataframes and converts to csv for handling optimization
-            df_store_data = pd.concat(df_list, ignore_index=True)
-            df_store_data.to_csv('df_stores.csv', index=False)
+        def retrieve_all_stores() -> pd.DataFrame:
+            # Without a stores checkpoint the fetched stores are only kept for the current crawl.
+            checkpoint = self.stores_checkpoint or CrawlCheckpoint()
+            crawler = StoresCrawler(checkpoint, requests_per_second=requests_per_second, max_workers=max_workers)
+            with self.create_api_session(header_dict, pool_size=max_workers, rate_limiter=crawler.rate_limiter) as session:
+                return crawler.crawl(stores_data_endpoint, no_of_stores,
+                                     lambda store_number: self.retrieve_store_details(session, stores_data_endpoint, store_number))
+
+        # The API does not report a version, the cached data is used until the number of stores changes or the entry expires.
+        df_store_data = self._cached(stores_data_endpoint, f'number_stores={no_of_stores}', retrieve_all_stores)
         return df_store_data
     
-    def extract_from_s3(self, address: str) -> pd.DataFrame:
+    def _s3_client(self):
+        """
+        Returns the boto3 s3 client, created on the first call and reused afterwards (boto3 clients are thread safe).
         """
-        Extracts a csv or json file from AWS s3 bucket.
+        with self._s3_client_lock:
+            if self._s3 is None:
+                self._s3 = boto3.client('s3')
+        return self._s3
+
+    def split_s3_address(self, address: str) -> tuple:
+        """
+        Splits an s3 address to the bucket and key, the key can contain nested prefixes.
 
         Args:
-            address (str): address of the resuorce on s3
+            address (str): address of the resource on s3, for example s3://bucket/prefix/file.csv
         Returns:
-            pd.DataFrame: pandas dataframe created from the downloaded file
+            tuple: the bucket name and the key
         """
-        # Takes in the address and splits it to: bucket, key and filename.
-        address_split = re.split('://|/', address)
-        s3 = boto3.client('s3')
-        bucket = address_split[1]
-        key = address_split[2]
-        filename = address_split[2]
-        s3.download_file(Bucket=bucket, Key=key, Filename=filename)
+        bucket, _, key = address.split('://', 1)[-1].partition('/')
+        return bucket, key
 
-        # Checks if the file is csv or json and converts to dataframe.
-        with open(filename, 'r') as f:
-            if ".csv" in filename:
-                df_products = pd.read_csv(filename, index_col=0)
-                f.close()
-            elif ".json" in filename:
-                df_products = pd.read_json(filename)
-                f.close()
-        return df_products
+    def list_s3_objects(self, bucket: str, key_pattern: str) -> list:
+        """
+        Lists the objects matching a key, a prefix (ending with "/") or a glob pattern (containing *, ? or [).
+
+        Args:
+            bucket (str): name of the bucket
+            key_pattern (str): key, prefix or glob pattern
+        Returns:
+            list: tuples of the key and ETag of each matching object, sorted by key
+        """
+        s3 = self._s3_client()
+        wildcard_position = min([key_pattern.find(character) for character in '*?[' if character in key_pattern], default=-1)
+        if wildcard_position == -1 and key_pattern and not key_pattern.endswith('/'):
+            etag = s3.head_object(Bucket=bucket, Key=key_pattern)['ETag'] if self.cache is not None else None
+            return [(key_pattern, etag)]
+
+        prefix = key_pattern if wildcard_position == -1 else key_pattern[:wildcard_position]
+        objects = []
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            for s3_object in page.get('Contents', []):
+                key = s3_object['Key']
+                if key.endswith('/') or (wildcard_position != -1 and not fnmatch.fnmatchcase(key, key_pattern)):
+                    continue
+                objects.append((key, s3_object['ETag']))
+        return sorted(objects)
+
+    def read_s3_object(self, bucket: str, key: str) -> pd.DataFrame:
+        """
+        Downloads a csv or json object to memory and parses it to a dataframe, without writing a local file.
+        Large objects are downloaded in concurrent ranged requests.
+
+        Args:
+            bucket (str): name of the bucket
+            key (str): key of the object
+        Returns:
+            pd.DataFrame: dataframe created from the object
+        """
+        buffer = BytesIO()
+        self._s3_client().download_fileobj(Bucket=bucket, Key=key, Fileobj=buffer, Config=self.S3_TRANSFER_CONFIG)
+        buffer.seek(0)
+
+        # Checks if the object is csv or json and converts to dataframe.
+        if ".csv" in key:
+            return pd.read_csv(buffer, index_col=0)
+        elif ".json" in key:
+            return pd.read_json(buffer)
+        raise ValueError(f'Unsupported file type: {key}')
+
+    def extract_from_s3(self, address: str, max_workers: int = 8, iterate: bool = False):
+        """
+        Extracts csv or json files from AWS s3 bucket. The address can point to a single object, a prefix ending with "/"
+        or a glob pattern, for example s3://bucket/products/*.csv. Matching objects are downloaded concurrently through one
+        shared client and each object is only downloaded if its ETag differs from the cached version. When iterating, at most
+        max_workers objects are held in memory before they are yielded.
+
+        Args:
+            address (str): address of the resuorce on s3
+            max_workers (int): maximum number of objects downloaded at the same time
+            iterate (bool): returns an iterator yielding the dataframe of each object instead of one concatenated dataframe
+        Returns:
+            pd.DataFrame: pandas dataframe created from the downloaded objects, or an iterator of dataframes if iterate is True
+        """
+        bucket, key_pattern = self.split_s3_address(address)
+        objects = self.list_s3_objects(bucket, key_pattern)
+        if not objects:
+            raise ValueError(f'No objects found at {address}')
 
+        def read_object(s3_object: tuple) -> pd.DataFrame:
+            key, etag = s3_object
+            return self._cached(f's3://{bucket}/{key}', etag, lambda: self.read_s3_object(bucket, key))
 
+        def read_objects() -> Iterator[pd.DataFrame]:
+            # at most max_workers objects are downloaded or waiting to be yielded at a time, the next download is only
+            # submitted when a dataframe is taken, so that the objects are not all held in memory
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = deque()
+                try:
+                    for s3_object in objects:
+                        pending.append(executor.submit(read_object, s3_object))
+                        if len(pending) >= max_workers:
+                            yield pending.popleft().result()
+                    while pending:
+                        yield pending.popleft().result()
+                finally:
+                    for future in pending:
+                        future.cancel()
 
+        if iterate:
+            return read_objects()
+        if len(objects) == 1:
+            return read_object(objects[0])
+        return pd.concat(read_objects())
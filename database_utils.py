@@ -1,17 +1,51 @@
-from sqlalchemy import create_engine, inspect
+from dtype_planner import DtypePlanner
+from instrumentation import instrumented
+from io import StringIO
+from sqlalchemy import create_engine, event, inspect, text
+import csv
 import pandas as pd
+import threading
+import time
 import yaml 
 
 
+@instrumented
 class DatabaseConnector:
     """
     Handles connectivity and interactions with databases.
 
         Args:
             db_creds_yaml: yaml file containing database credentials
+            pool_size (int): number of connections kept open in the engine's connection pool
+            max_overflow (int): number of connections allowed above pool_size at peak load
+            pool_pre_ping (bool): tests connections for liveness before they are taken from the pool
+            pool_recycle (int): number of seconds after which a pooled connection is replaced
     """
-    def __init__(self, db_creds) -> None:
+    # table in which the last loaded key of each source table is stored for incremental loads
+    STATE_TABLE = 'pipeline_state'
+    # marker of missing values in the CSV buffers loaded with COPY, distinct from empty text
+    COPY_NULL = r'\N'
+
+    def __init__(self, db_creds, pool_size: int = 5, max_overflow: int = 10, pool_pre_ping: bool = True,
+                 pool_recycle: int = 1800) -> None:
         self.db_creds = self.read_db_creds(db_creds)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self._table_names = None
+        self.dtype_planner = DtypePlanner()
+        self.connection_stats = {'connects': 0, 'checkouts': 0, 'connect_time': 0.0}
+        # the pool events fire on the threads of the pipeline stages, a separate lock keeps them independent of _engine_lock
+        self._stats_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
         
     def read_db_creds(self, creds_file: str) -> dict:
         """
@@ -30,47 +64,275 @@ class DatabaseConnector:
     def init_db_engine(self):
         """
         Get database credentials using the read_db_creds() method and intializes
-        a sqlalchemy database engine. Takes in an optional argument with a path to a file containing database credentials.
-        If the argument is not passed the credentials are taken from the db_creds file as default.
+        a sqlalchemy database engine. The engine is created on the first call and reused afterwards, so all methods share
+        one connection pool. Connection counts and time spent connecting are recorded in the connection_stats dictionary.
 
         Returns:
             engine: an sqlalchemy database engine
         """
-        RDS_DATABASE_TYPE = 'postgresql'
-        RDS_DBAPI = 'psycopg2'
-        RDS_HOST = self.db_creds.get("RDS_HOST")
-        RDS_USER = self.db_creds.get("RDS_USER")
-        RDS_PASSWORD = self.db_creds.get("RDS_PASSWORD")
-        RDS_DATABASE = self.db_creds.get("RDS_DATABASE")
-        RDS_PORT = self.db_creds.get("RDS_PORT")
-        engine = create_engine(f"{RDS_DATABASE_TYPE}+{RDS_DBAPI}://{RDS_USER}:{RDS_PASSWORD}@{RDS_HOST}:{RDS_PORT}/{RDS_DATABASE}")
-        return engine
+        with self._engine_lock:
+            if self._engine is None:
+                RDS_DATABASE_TYPE = 'postgresql'
+                RDS_DBAPI = 'psycopg2'
+                RDS_HOST = self.db_creds.get("RDS_HOST")
+                RDS_USER = self.db_creds.get("RDS_USER")
+                RDS_PASSWORD = self.db_creds.get("RDS_PASSWORD")
+                RDS_DATABASE = self.db_creds.get("RDS_DATABASE")
+                RDS_PORT = self.db_creds.get("RDS_PORT")
+                engine = create_engine(f"{RDS_DATABASE_TYPE}+{RDS_DBAPI}://{RDS_USER}:{RDS_PASSWORD}@{RDS_HOST}:{RDS_PORT}/{RDS_DATABASE}",
+                                       pool_size=self.pool_size, max_overflow=self.max_overflow,
+                                       pool_pre_ping=self.pool_pre_ping, pool_recycle=self.pool_recycle)
+                event.listen(engine, 'do_connect', self._timed_connect)
+                event.listen(engine, 'checkout', self._count_checkout)
+                self._engine = engine
+        return self._engine
+
+    def _timed_connect(self, dialect, conn_rec, cargs, cparams):
+        """
+        Opens a new DBAPI connection on behalf of the engine and records the time it took.
+        """
+        start = time.perf_counter()
+        dbapi_conn = dialect.connect(*cargs, **cparams)
+        connect_time = time.perf_counter() - start
+        with self._stats_lock:
+            self.connection_stats['connects'] += 1
+            self.connection_stats['connect_time'] += connect_time
+        return dbapi_conn
+
+    def _count_checkout(self, dbapi_conn, conn_rec, conn_proxy) -> None:
+        """
+        Counts connections taken from the pool.
+        """
+        with self._stats_lock:
+            self.connection_stats['checkouts'] += 1
+
+    def close(self) -> None:
+        """
+        Closes all pooled connections and discards the engine. A new engine is created if the connector is used again.
+        """
+        with self._engine_lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+        self.invalidate_table_cache()
     
-    def list_db_tables(self) -> list:
+    def list_db_tables(self, refresh: bool = False) -> list:
         """
-        Establishes an active connection to the database by using the engine returned from the init_db_engine method.
-        The databse is inspected and names of tables returned with the use of the inspect() function and the following
-        get_table_names() method.
+        Inspects the database using the engine returned from the init_db_engine method and returns the names of tables
+        with the use of the inspect() function and the following get_table_names() method.
+        The list is cached after the first call, pass refresh=True or call invalidate_table_cache() to inspect the database again.
 
+        Args:
+            refresh (bool): ignores the cached list of tables
         Returns:
             table_names: a list of table names, which are available in the database
         """
-        db_engine = self.init_db_engine()
-        with db_engine.execution_options(isolation_level='AUTOCOMMIT').connect():
+        if self._table_names is None or refresh:
+            db_engine = self.init_db_engine()
             inspector = inspect(db_engine)
-            table_names = inspector.get_table_names()
-        return table_names
+            self._table_names = inspector.get_table_names()
+        return self._table_names
+
+    def invalidate_table_cache(self) -> None:
+        """
+        Discards the cached list of tables, the next call to list_db_tables() inspects the database again.
+        """
+        self._table_names = None
     
-    def upload_to_db(self, df: pd.DataFrame, table_name: str) -> None:
+    def get_table_columns(self, table_name: str) -> list:
+        """
+        Returns the column names of a table, in the order of the table.
+
+        Args:
+            table_name (str): the name of the table
+        Returns:
+            list: column names of the table
+        """
+        inspector = inspect(self.init_db_engine())
+        return [column['name'] for column in inspector.get_columns(table_name)]
+
+    def copy_insert(self, table, conn, keys: list, data_iter) -> None:
+        """
+        Insertion method for pandas.DataFrame.to_sql(), which writes the rows to an in-memory CSV buffer and streams it into
+        the table with a single Postgres COPY FROM STDIN command instead of sending one INSERT per row.
+
+        Args:
+            table (pandas.io.sql.SQLTable): the table the rows are inserted into
+            conn (sqlalchemy.engine.Connection): the connection used by to_sql()
+            keys (list): column names
+            data_iter (iterable): rows to insert
+        """
+        buffer = StringIO()
+        self.write_copy_csv(buffer, data_iter)
+        buffer.seek(0)
+
+        columns = ', '.join(f'"{key}"' for key in keys)
+        table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{self.COPY_NULL}')", buffer)
+
+    @classmethod
+    def write_copy_csv(cls, buffer, rows) -> None:
+        """
+        Writes rows as CSV for COPY ... WITH (FORMAT csv, NULL '\\N'). Missing values, which to_sql() passes as None, are
+        written as an unquoted \\N, so that empty strings are loaded as empty text and not as NULL. The rare text value equal
+        to \\N is quoted, since COPY only reads unquoted values as NULL.
+
+        Args:
+            buffer (TextIO): the buffer the CSV lines are written to
+            rows (iterable): rows of values
+        """
+        writer = csv.writer(buffer)
+        for row in rows:
+            if cls.COPY_NULL in row:
+                buffer.write(','.join(cls.COPY_NULL if value is None else '"' + str(value).replace('"', '""') + '"'
+                                      for value in row) + writer.dialect.lineterminator)
+            else:
+                writer.writerow([cls.COPY_NULL if value is None else value for value in row])
+
+    def upload_to_db(self, df: pd.DataFrame, table_name: str, if_exists: str = 'replace', dtype: dict = None,
+                     chunk_size: int = 100000, plan_dtypes: bool = True) -> None:
         """
         Takes in a pandas dataframe and uploads the data to a local database. The new table name is passed in the table_name
-        argument.
+        argument. Passing if_exists='append' adds the rows to an existing table, which allows uploading data in chunks.
+        Rows are bulk loaded with COPY (see copy_insert()). When replacing a table the data is first loaded into a staging
+        table, which is then swapped in within the same transaction, so the old table stays available until the load succeeds.
+        When a table is created, the data types of its columns are planned by the DtypePlanner and the table is created with
+        the matching Postgres types. The dataframe is uploaded as given, without a converted copy; convert it to the compact
+        pandas types with dtype_planner.apply() after cleaning to reduce the memory it holds until the upload.
 
         Args:
             df (pd.DataFrame): a dataframe to be processed into an SQL table
             table_name (str): the name of the new table to be created
+            if_exists (str): behaviour when the table already exists, either 'replace' or 'append'
+            dtype (dict): optional mapping of column names to SQL types used when the table is created
+            chunk_size (int): number of rows written to the COPY buffer at a time
+            plan_dtypes (bool): plans the column types of a new table with the DtypePlanner
+        """
+        if plan_dtypes and if_exists != 'append':
+            dtype = {**self.dtype_planner.sql_types(self.dtype_planner.plan(df)), **(dtype or {})}
+
+        engine = self.init_db_engine()
+        with engine.begin() as conn:
+            if if_exists == 'append':
+                df.to_sql(table_name, conn, if_exists='append', index=False, dtype=dtype, method=self.copy_insert,
+                          chunksize=chunk_size)
+            else:
+                staging_table_name = f'{table_name}_staging'
+                df.to_sql(staging_table_name, conn, if_exists='replace', index=False, dtype=dtype, method=self.copy_insert,
+                          chunksize=chunk_size)
+                conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+                conn.execute(text(f'ALTER TABLE "{staging_table_name}" RENAME TO "{table_name}"'))
+        self.invalidate_table_cache()
+        if if_exists == 'append':
+            print(f'{len(df)} rows have been appended to table {table_name}.')
+        else:
+            print(f'Table {table_name} has been created.')
+
+    def upsert_to_db(self, df: pd.DataFrame, table_name: str, key_columns: list, chunk_size: int = 100000) -> None:
+        """
+        Inserts new rows and updates existing rows of a table, matching rows on the key columns. Unlike upload_to_db() the
+        table is not replaced, so primary keys and other constraints added to it are kept. The rows are bulk loaded into a
+        staging table with COPY and merged with INSERT ... ON CONFLICT DO UPDATE. If the table does not exist yet, it is
+        created with upload_to_db().
+
+        Args:
+            df (pd.DataFrame): a dataframe with the rows to insert or update
+            table_name (str): the name of the table to update
+            key_columns (list): columns identifying a row, a unique index is created on them if the table has none
+            chunk_size (int): number of rows written to the COPY buffer at a time
+        Raises:
+            ValueError: if the columns of the dataframe differ from the columns of the existing table
         """
+        # keeps the last version of each row, ON CONFLICT cannot update the same row twice in one statement
+        # and the unique index of a new table cannot be created on repeated keys
+        df = df.drop_duplicates(subset=key_columns, keep='last')
+
         engine = self.init_db_engine()
-        with engine.execution_options(isolation_level='AUTOCOMMIT').connect():
-            df.to_sql(table_name, engine, if_exists='replace', index=False)
-        print(f'Table {table_name} has been created.')
+        if table_name not in self.list_db_tables():
+            self.upload_to_db(df, table_name, chunk_size=chunk_size)
+            with engine.begin() as conn:
+                self._create_unique_key(conn, table_name, key_columns)
+            return
+
+        # a column missing from the dataframe would be set to NULL in the inserted rows, an extra column fails the insert
+        table_columns = self.get_table_columns(table_name)
+        missing_columns = [column for column in table_columns if column not in df.columns]
+        extra_columns = [column for column in df.columns if column not in table_columns]
+        if missing_columns or extra_columns:
+            raise ValueError(f'The columns of the dataframe do not match the table {table_name}: '
+                             f'missing {missing_columns}, not in the table {extra_columns}.')
+
+        staging_table_name = f'{table_name}_upsert'
+        columns = ', '.join(f'"{column}"' for column in df.columns)
+        keys = ', '.join(f'"{column}"' for column in key_columns)
+        updates = ', '.join(f'"{column}" = EXCLUDED."{column}"' for column in df.columns if column not in key_columns)
+        conflict_action = f'DO UPDATE SET {updates}' if updates else 'DO NOTHING'
+
+        with engine.begin() as conn:
+            self._create_unique_key(conn, table_name, key_columns)
+            conn.execute(text(f'DROP TABLE IF EXISTS "{staging_table_name}"'))
+            conn.execute(text(f'CREATE UNLOGGED TABLE "{staging_table_name}" (LIKE "{table_name}" INCLUDING DEFAULTS)'))
+            df.to_sql(staging_table_name, conn, if_exists='append', index=False, method=self.copy_insert, chunksize=chunk_size)
+            conn.execute(text(f'INSERT INTO "{table_name}" ({columns}) SELECT {columns} FROM "{staging_table_name}" '
+                              f'ON CONFLICT ({keys}) {conflict_action}'))
+            conn.execute(text(f'DROP TABLE "{staging_table_name}"'))
+        print(f'{len(df)} rows have been upserted to table {table_name}.')
+
+    def _create_unique_key(self, conn, table_name: str, key_columns: list) -> None:
+        """
+        Creates a unique index on the key columns, unless the table already has a primary key, unique constraint or unique
+        index on exactly these columns (for example the primary keys added to the dimension tables).
+        """
+        inspector = inspect(conn)
+        unique_keys = [inspector.get_pk_constraint(table_name)['constrained_columns']]
+        unique_keys += [constraint['column_names'] for constraint in inspector.get_unique_constraints(table_name)]
+        unique_keys += [index['column_names'] for index in inspector.get_indexes(table_name) if index['unique']]
+        if not any(set(unique_key) == set(key_columns) for unique_key in unique_keys):
+            keys = ', '.join(f'"{column}"' for column in key_columns)
+            conn.execute(text(f'CREATE UNIQUE INDEX "{table_name}_{"_".join(key_columns)}_key" ON "{table_name}" ({keys})'))
+
+    def get_high_water_mark(self, source_table: str):
+        """
+        Returns the last key value loaded from the source table, as stored in the state table.
+
+        Args:
+            source_table (str): the name of the source table
+        Returns:
+            str: the last loaded key value, None if the table has not been loaded yet
+        """
+        engine = self.init_db_engine()
+        with engine.begin() as conn:
+            self._create_state_table(conn)
+            result = conn.execute(text(f'SELECT high_water_mark FROM {self.STATE_TABLE} WHERE source_table = :source_table'),
+                                  {'source_table': source_table}).scalar()
+        return result
+
+    def set_high_water_mark(self, source_table: str, key_column: str, value, conn=None) -> None:
+        """
+        Stores the last key value loaded from the source table in the state table. When a connection is passed, the value
+        is written in its transaction, so that it is committed together with the data it describes.
+
+        Args:
+            source_table (str): the name of the source table
+            key_column (str): the column holding the key in the source table
+            value: the last loaded key value, stored as text
+            conn (Connection): optional connection with an open transaction
+        """
+        if conn is None:
+            with self.init_db_engine().begin() as conn:
+                self.set_high_water_mark(source_table, key_column, value, conn)
+            return
+        self._create_state_table(conn)
+        conn.execute(text(f'INSERT INTO {self.STATE_TABLE} (source_table, key_column, high_water_mark, updated_at) '
+                          'VALUES (:source_table, :key_column, :value, now()) '
+                          'ON CONFLICT (source_table) DO UPDATE SET key_column = EXCLUDED.key_column, '
+                          'high_water_mark = EXCLUDED.high_water_mark, updated_at = EXCLUDED.updated_at'),
+                     {'source_table': source_table, 'key_column': key_column, 'value': str(value)})
+
+    def _create_state_table(self, conn) -> None:
+        """
+        Creates the state table for incremental loads if it does not exist.
+        """
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS {self.STATE_TABLE} ('
+                          'source_table TEXT PRIMARY KEY, key_column TEXT NOT NULL, high_water_mark TEXT, updated_at TIMESTAMP)'))
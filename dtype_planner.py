@@ -0,0 +1,142 @@
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.types import BigInteger, Boolean, Date, DateTime, Float, SmallInteger, Text, VARCHAR
+import pandas as pd
+
+STRING_DTYPE = 'string[pyarrow]'
+
+
+class DtypePlanner:
+    """
+    Profiles a cleaned dataframe and plans a compact data type for each column, together with the matching Postgres
+    column type used when the table is created. This replaces casting the columns with ALTER TABLE after the upload.
+
+    Text columns with few distinct values become categories and other text columns become (pyarrow backed) strings.
+    Integer columns are downcast to the smallest integer type holding their values, float columns to single precision only
+    if every value is unchanged by it, so that prices are not rounded. Text columns in which every entry is a UUID are
+    stored as the 16 byte Postgres UUID type.
+
+    The SQL types must also hold the rows appended later (further orders_table partitions and incremental upserts), so unlike
+    the pandas types they are not fitted to the values seen in the profiled dataframe. Codes with a known length and small integer columns get
+    the types of the Task 1-7 casting scripts (FIXED_COLUMN_TYPES), other text columns VARCHAR(255) or TEXT and other
+    integer columns BIGINT.
+
+        Args:
+            category_ratio (float): maximum share of distinct values in a text column for it to become a category
+            max_categories (int): maximum number of distinct values in a text column for it to become a category
+    """
+    UUID_PATTERN = r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\Z'
+
+    # column types set by the Task 1-7 casting scripts, keyed by column name
+    FIXED_COLUMN_TYPES = {
+        'card_number': VARCHAR(19),
+        'store_code': VARCHAR(12),
+        'product_code': VARCHAR(11),
+        'country_code': VARCHAR(2),
+        'EAN': VARCHAR(17),
+        'card_provider': VARCHAR(27),
+        'time_period': VARCHAR(10),
+        'weight_class': VARCHAR(14),
+        'staff_numbers': SmallInteger(),
+        'product_quantity': SmallInteger(),
+        'longitude': Float(precision=53),
+        'latitude': Float(precision=53),
+    }
+
+    def __init__(self, category_ratio: float = 0.5, max_categories: int = 1000) -> None:
+        self.category_ratio = category_ratio
+        self.max_categories = max_categories
+
+    def plan(self, df: pd.DataFrame) -> dict:
+        """
+        Plans the data types of all columns of the dataframe.
+
+        Args:
+            df (pd.DataFrame): cleaned dataframe
+        Returns:
+            dict: dictionaries with the pandas data type ('dtype') and SQL type ('sql_type'), keyed by column name
+        """
+        return {column: self.plan_column(df[column]) for column in df.columns}
+
+    def plan_column(self, series: pd.Series) -> dict:
+        """
+        Plans the pandas data type and SQL type of a single column.
+
+        Args:
+            series (pd.Series): the column to profile
+        Returns:
+            dict: the pandas data type ('dtype') and SQL type ('sql_type') of the column
+        """
+        if pd.api.types.is_bool_dtype(series):
+            return {'dtype': series.dtype, 'sql_type': Boolean()}
+        if pd.api.types.is_integer_dtype(series):
+            dtype = pd.to_numeric(series, downcast='integer').dtype
+            return {'dtype': dtype, 'sql_type': self.FIXED_COLUMN_TYPES.get(series.name, BigInteger())}
+        if pd.api.types.is_float_dtype(series):
+            # integer columns with missing values are floats, they are not given the fixed integer types
+            sql_type = self.FIXED_COLUMN_TYPES.get(series.name)
+            return {'dtype': self._float_dtype(series), 'sql_type': sql_type if isinstance(sql_type, Float) else Float(precision=53)}
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.dropna()
+            is_date = len(values) > 0 and (values == values.dt.normalize()).all()
+            return {'dtype': series.dtype, 'sql_type': Date() if is_date else DateTime()}
+
+        values = series.dropna()
+        if pd.api.types.infer_dtype(values, skipna=True) == 'date':
+            return {'dtype': series.dtype, 'sql_type': Date()}
+
+        values = values.astype(str)
+        if len(values) == 0:
+            return {'dtype': STRING_DTYPE, 'sql_type': self.FIXED_COLUMN_TYPES.get(series.name, Text())}
+        if values.str.match(self.UUID_PATTERN).all():
+            return {'dtype': STRING_DTYPE, 'sql_type': UUID(as_uuid=False)}
+
+        number_of_values = values.nunique()
+        dtype = STRING_DTYPE
+        if number_of_values <= self.max_categories and number_of_values / len(values) <= self.category_ratio:
+            dtype = 'category'
+        return {'dtype': dtype, 'sql_type': self._text_type(series.name, values.str.len().max())}
+
+    def _float_dtype(self, series: pd.Series):
+        """
+        Returns the float type of smallest precision storing every value of the column exactly.
+        """
+        downcast = pd.to_numeric(series, downcast='float')
+        if downcast.dtype != series.dtype and not (downcast.astype(series.dtype) == series)[series.notna()].all():
+            return series.dtype
+        return downcast.dtype
+
+    def _text_type(self, column: str, max_length: int):
+        """
+        Returns the SQL type of a text column, the fixed type of a known code column or VARCHAR(255),
+        or TEXT if the column already holds longer entries.
+        """
+        if column in self.FIXED_COLUMN_TYPES:
+            return self.FIXED_COLUMN_TYPES[column]
+        return VARCHAR(255) if max_length <= 255 else Text()
+
+    def apply(self, df: pd.DataFrame, plan: dict = None) -> pd.DataFrame:
+        """
+        Converts the columns of the dataframe to their planned data types.
+
+        Args:
+            df (pd.DataFrame): cleaned dataframe
+            plan (dict): plan returned by the plan() method, the dataframe is profiled if it is not passed
+        Returns:
+            df (pd.DataFrame): dataframe with the planned data types
+        """
+        plan = plan or self.plan(df)
+        dtypes = {column: column_plan['dtype'] for column, column_plan in plan.items() if df[column].dtype != column_plan['dtype']}
+        if dtypes:
+            df = df.astype(dtypes)
+        return df
+
+    def sql_types(self, plan: dict) -> dict:
+        """
+        Returns the planned SQL types, in the format of the dtype argument of DataFrame.to_sql().
+
+        Args:
+            plan (dict): plan returned by the plan() method
+        Returns:
+            dict: sqlalchemy types keyed by column name
+        """
+        return {column: column_plan['sql_type'] for column, column_plan in plan.items()}
@@ -0,0 +1,212 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+import cProfile
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # the resource module is not available on Windows, peak RSS is not recorded there
+    resource = None
+
+
+class Profiler:
+    """
+    Records the wall time, rows in and out, dataframe memory and peak RSS of every instrumented method call, and the
+    wall time of every pipeline stage. Recording is disabled until enable() is called, instrumented methods then cost
+    one attribute lookup per call. Selected stages can additionally be captured with cProfile and tracemalloc.
+    """
+    def __init__(self) -> None:
+        self.enabled = False
+        self.capture_stages = set()
+        self.profile_dir = '.'
+        self.steps = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def enable(self, capture_stages: list = (), profile_dir: str = '.') -> None:
+        """
+        Starts recording method calls and stages.
+
+        Args:
+            capture_stages (list): names of the stages captured with cProfile and tracemalloc
+            profile_dir (str): directory in which the cProfile statistics of captured stages are saved
+        """
+        self.enabled = True
+        self.capture_stages = set(capture_stages)
+        self.profile_dir = profile_dir
+        if self.capture_stages and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record_step(self, step: str, seconds: float, rows_in: int, rows_out: int, frame_bytes_out: int) -> None:
+        """
+        Adds a method call to the totals of the step.
+
+        Args:
+            step (str): name of the step, class and method name
+            seconds (float): wall time of the call
+            rows_in (int): number of rows in the dataframes passed to the call
+            rows_out (int): number of rows in the dataframes returned by the call
+            frame_bytes_out (int): memory used by the dataframes returned by the call
+        """
+        peak_rss = self.peak_rss()
+        with self._lock:
+            totals = self.steps.setdefault(step, {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                                  'frame_bytes_out': 0, 'peak_rss_bytes': 0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals['rows_in'] += rows_in
+            totals['rows_out'] += rows_out
+            totals['frame_bytes_out'] += frame_bytes_out
+            totals['peak_rss_bytes'] = max(totals['peak_rss_bytes'], peak_rss)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager recording the wall time of a pipeline stage. Stages selected in enable() are also profiled with
+        cProfile (saved to <profile_dir>/<stage>.prof) and their peak traced memory is recorded. cProfile only follows the
+        thread running the stage, while tracemalloc is shared by all stages running at the same time.
+
+        Args:
+            name (str): name of the stage
+        """
+        if not self.enabled:
+            yield
+            return
+        capture = name in self.capture_stages
+        profile = cProfile.Profile() if capture else None
+        if capture:
+            tracemalloc.reset_peak()
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'seconds': time.perf_counter() - start}
+            if capture:
+                profile.disable()
+                profile.dump_stats(os.path.join(self.profile_dir, f'{name}.prof'))
+                record['traced_memory_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            with self._lock:
+                self.stages[name] = record
+
+    def peak_rss(self) -> int:
+        """
+        Returns the peak resident set size of the process in bytes, 0 where it cannot be measured.
+        """
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def report(self) -> dict:
+        """
+        Returns the recorded steps and stages.
+        """
+        with self._lock:
+            return {'steps': dict(self.steps), 'stages': dict(self.stages), 'peak_rss_bytes': self.peak_rss()}
+
+    def write_report(self, path: str) -> None:
+        """
+        Writes the recorded steps and stages to a file, in the Prometheus text format if the path ends with .prom
+        and as JSON otherwise.
+
+        Args:
+            path (str): path of the report file
+        """
+        report = self.report()
+        with open(path, 'w') as f:
+            if path.endswith('.prom'):
+                f.write(self._to_prometheus(report))
+            else:
+                json.dump(report, f, indent=2)
+
+    def _to_prometheus(self, report: dict) -> str:
+        """
+        Formats the report as Prometheus textfile collector metrics.
+        """
+        lines = []
+        for metric in ['calls', 'seconds', 'rows_in', 'rows_out', 'frame_bytes_out', 'peak_rss_bytes']:
+            lines.append(f'# TYPE pipeline_step_{metric} gauge')
+            for step, totals in sorted(report['steps'].items()):
+                lines.append(f'pipeline_step_{metric}{{step="{step}"}} {totals[metric]}')
+        lines.append('# TYPE pipeline_stage_seconds gauge')
+        for stage, record in sorted(report['stages'].items()):
+            lines.append(f'pipeline_stage_seconds{{stage="{stage}"}} {record["seconds"]}')
+        lines.append('# TYPE pipeline_peak_rss_bytes gauge')
+        lines.append(f'pipeline_peak_rss_bytes {report["peak_rss_bytes"]}')
+        return '\n'.join(lines) + '\n'
+
+
+# profiler shared by all instrumented classes
+profiler = Profiler()
+
+
+def _frame_rows(values) -> int:
+    return sum(len(value) for value in values if isinstance(value, pd.DataFrame))
+
+
+def _frame_bytes(value) -> int:
+    return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else 0
+
+
+def _record_generator(step: str, generator: Iterator, rows_in: int, seconds: float) -> Iterator:
+    """
+    Yields the values of a generator returned by an instrumented method. The time spent producing each value is added to
+    the time of the call, and the step is recorded with the rows of all yielded dataframes once the generator is exhausted
+    or closed.
+    """
+    rows_out = 0
+    frame_bytes_out = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(generator)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - start
+            rows_out += _frame_rows([value])
+            frame_bytes_out += _frame_bytes(value)
+            yield value
+    finally:
+        generator.close()
+        profiler.record_step(step, seconds, rows_in, rows_out, frame_bytes_out)
+
+
+def _instrument_method(step: str, method):
+    """
+    Wraps a method so that its calls are recorded by the profiler. Generators returned by the method (by generator methods
+    or by methods returning a generator, such as chunked reads) are wrapped, so that the call is recorded once the generator
+    is consumed, with the rows of all yielded dataframes.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            return method(*args, **kwargs)
+        rows_in = _frame_rows(list(args) + list(kwargs.values()))
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        if inspect.isgenerator(result):
+            return _record_generator(step, result, rows_in, seconds)
+        profiler.record_step(step, seconds, rows_in, _frame_rows([result]), _frame_bytes(result))
+        return result
+    return wrapper
+
+
+def instrumented(cls):
+    """
+    Class decorator recording every call to the public methods of the class with the shared profiler.
+    """
+    for name, attribute in list(vars(cls).items()):
+        if inspect.isfunction(attribute) and not name.startswith('_'):
+            setattr(cls, name, _instrument_method(f'{cls.__name__}.{name}', attribute))
+    return cls
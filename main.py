@@ -1,31 +1,146 @@
+from data_cache import DataCache
 from data_extraction import DataExtractor
 from data_cleaning import DataCleaning
 from database_utils import DatabaseConnector
 from dotenv import load_dotenv
+from instrumentation import profiler
+from pipeline import Pipeline, PipelineStage
+from reporting import SalesReports
+from sharded_cleaning import ShardedCleaner, drop_duplicates
+from staging import StagingArea
+from stores_crawler import CrawlCheckpoint
+from validation import DataValidator
+import argparse
 import os
-import pandas as pd
 
 
-def process_user_data() -> None:
+STAGE_NAMES = ['users', 'cards', 'stores', 'products', 'date_times', 'orders', 'reports']
+
+# stages loading the dimension tables joined by the sales summaries, the summaries are rebuilt when one of them has run
+REPORT_DIMENSION_STAGES = {'stores', 'products', 'date_times'}
+
+# data types of the orders_table columns, so that every chunk read from the remote database has the same types
+# (card numbers are text, as in dim_card_details, and all-null columns do not change type between chunks)
+ORDERS_TABLE_DTYPES = {
+    'level_0': 'int64',
+    'index': 'int64',
+    'date_uuid': 'string',
+    'first_name': 'string',
+    'last_name': 'string',
+    'user_uuid': 'string',
+    'card_number': 'string',
+    'store_code': 'string',
+    'product_code': 'string',
+    'product_quantity': 'int64',
+}
+
+
+def load_incrementally(source_table: str, target_table: str, clean_function, key_columns: list, chunk_size: int = 50000,
+                       dtype: dict = None) -> None:
+    """
+    Retrieves only the rows added to the source table since the previous run, cleans them and upserts them to the target table.
+    The last loaded value of the "index" column is stored in the local state table after each chunk.
+
+        Args:
+            source_table (str): name of the table in the remote database
+            target_table (str): name of the table in the local database
+            clean_function (callable): DataCleaning method used to clean each chunk
+            key_columns (list): columns identifying a row in the target table
+            chunk_size (int): number of rows retrieved, cleaned and uploaded at a time
+            dtype (dict): optional mapping of column names to data types of the source table
+    """
+    last_index = local_database_conn.get_high_water_mark(source_table)
+    df_chunks = new_data_extractor.stream_rds_table(remote_database_conn, source_table, chunk_size=chunk_size,
+                                                    dtype=dtype, key_column='index', after=last_index)
+    for df_to_clean in df_chunks:
+        max_index = df_to_clean['index'].max()
+        df_clean = clean_function(df_to_clean)
+        df_clean = data_validator.validate(df_clean, target_table, data_cleaning.rejected_rows, if_exists='append')
+        local_database_conn.upsert_to_db(df_clean, target_table, key_columns)
+        local_database_conn.set_high_water_mark(source_table, 'index', max_index)
+
+def load_dimension_table(df, table_name: str, key_columns: list, incremental: bool = False) -> None:
+    """
+    Uploads a cleaned dimension table. Incremental runs upsert the rows on the primary key of the table (Task 8) instead
+    of replacing the table, so that its primary key and the foreign keys of orders_table referencing it are kept.
+
+        Args:
+            df (pd.DataFrame): cleaned dimension table
+            table_name (str): name of the table in the local database
+            key_columns (list): primary key columns of the table
+            incremental (bool): upserts the rows instead of replacing the table
+    """
+    if incremental:
+        local_database_conn.upsert_to_db(df, table_name, key_columns)
+    else:
+        local_database_conn.upload_to_db(df, table_name)
+
+def extract_and_clean(table_name: str, extract_function, clean_function, resume: bool = False):
+    """
+    Extracts, cleans and validates the data for a table, converts it to the compact data types planned by the DtypePlanner
+    and writes the raw and cleaned data to the staging area.
+    Rows failing validation are written to the quarantine table (see DataValidator). If resume is True
+    and the table has a cleaned snapshot that has not been uploaded yet, the snapshot is returned instead.
+
+        Args:
+            table_name (str): name of the table in the local database
+            extract_function (callable): function without arguments returning the raw data
+            clean_function (callable): function cleaning the raw data
+            resume (bool): reads the cleaned data from the staging area if the previous upload has failed
+        Returns:
+            pd.DataFrame: the cleaned data
+    """
+    if resume and staging.can_resume(table_name):
+        print(f'Resuming {table_name} from the cleaned snapshot.')
+        return staging.read(table_name, 'clean')
+    staging.clear(table_name)
+    df_raw = extract_function()
+    staging.write(table_name, 'raw', df_raw)
+    df_clean = clean_function(df_raw)
+    df_clean = data_validator.validate(df_clean, table_name, data_cleaning.rejected_rows)
+    # converts the cleaned data to the compact types once, so that they also reduce the memory held until the upload
+    df_clean = local_database_conn.dtype_planner.apply(df_clean)
+    staging.write(table_name, 'clean', df_clean)
+    return df_clean
+
+def process_user_data(incremental: bool = False, resume: bool = False) -> None:
     """
     Retrieves, cleans and uploads data for users.
+
+        Args:
+            incremental (bool): only loads users added since the previous run and keeps the existing table
+            resume (bool): uploads the cleaned snapshot from the staging area if the previous upload has failed
     """
-    df_user_data = new_data_extractor.read_rds_table(remote_database_conn, 'legacy_users')
-    df_user_data_clean = data_cleaning.clean_user_data(df_user_data)
+    if incremental:
+        load_incrementally('legacy_users', 'dim_user_details', data_cleaning.clean_user_data, ['user_uuid'])
+        return
+    df_user_data_clean = extract_and_clean('dim_user_details',
+                                           lambda: new_data_extractor.read_rds_table(remote_database_conn, 'legacy_users'),
+                                           lambda df: sharded_cleaner.clean(df, 'clean_user_data',
+                                                                            reduce=drop_duplicates(['user_uuid'], reject_key='user_uuid')),
+                                           resume)
     local_database_conn.upload_to_db(df_user_data_clean, 'dim_user_details')
+    local_database_conn.set_high_water_mark('legacy_users', 'index', df_user_data_clean['index'].max())
+    staging.mark_loaded('dim_user_details')
 
-def process_card_data(card_details_endpoint: str) -> None:
+def process_card_data(card_details_endpoint: str, pdf_workers: int = 1, incremental: bool = False, resume: bool = False) -> None:
     """
     Retrieves, cleans and uploads data for card details.
 
         Args:
             card_datails_endpoint (str): S3 endpoint for the pdf file containing card details data,
+            pdf_workers (int): number of processes extracting pages of the pdf file at the same time
+            incremental (bool): upserts the card details instead of replacing the table
+            resume (bool): uploads the cleaned snapshot from the staging area if the previous upload has failed
     """
-    df_card_details_from_pdf = new_data_extractor.retrieve_pdf_data(card_details_endpoint)    
-    df_card_details_clean = data_cleaning.clean_card_data(df_card_details_from_pdf)
-    local_database_conn.upload_to_db(df_card_details_clean, 'dim_card_details')
+    df_card_details_clean = extract_and_clean('dim_card_details',
+                                              lambda: new_data_extractor.retrieve_pdf_data(card_details_endpoint, max_workers=pdf_workers),
+                                              lambda df: sharded_cleaner.clean(df, 'clean_card_data'), resume)
+    load_dimension_table(df_card_details_clean, 'dim_card_details', ['card_number'], incremental)
+    staging.mark_loaded('dim_card_details')
 
-def process_stores_data(st_endpoint: str, st_data_endpoint: str, api_key: str ) -> None:
+def process_stores_data(st_endpoint: str, st_data_endpoint: str, api_key: str, api_rate: float = None, incremental: bool = False,
+                        resume: bool = False) -> None:
     """
     Retrieves, cleans and uploads data for stores.
     
@@ -33,65 +148,189 @@ def process_stores_data(st_endpoint: str, st_data_endpoint: str, api_key: str )
             st_endpoint (str): API end point for the total number of stores
             st_data_endpoint (str) : API endpoint for store details data
             x_api_key (str): API key
+            api_rate (float): maximum number of requests per second sent to the stores API
+            incremental (bool): upserts the store details instead of replacing the table
+            resume (bool): uploads the cleaned snapshot from the staging area if the previous upload has failed
     """
     header_dict = {"x-api-key":api_key}
-    no_of_stores = new_data_extractor.list_number_of_stores(st_endpoint, header_dict)
-    df_stores = new_data_extractor.retrieve_stores_data(st_data_endpoint, no_of_stores, header_dict)
-    df_stores_clean = data_cleaning.clean_store_data(df_stores)
-    local_database_conn.upload_to_db(df_stores_clean, 'dim_store_details')
 
-def process_products_data(products_endpoint: str) -> None:
+    def retrieve_stores():
+        no_of_stores = new_data_extractor.list_number_of_stores(st_endpoint, header_dict)
+        return new_data_extractor.retrieve_stores_data(st_data_endpoint, no_of_stores, header_dict,
+                                                       requests_per_second=api_rate)
+
+    df_stores_clean = extract_and_clean('dim_store_details', retrieve_stores, data_cleaning.clean_store_data, resume)
+    load_dimension_table(df_stores_clean, 'dim_store_details', ['store_code'], incremental)
+    staging.mark_loaded('dim_store_details')
+
+def process_products_data(products_endpoint: str, incremental: bool = False, resume: bool = False) -> None:
     """
     Retrieves, cleans and uploads data for products.
     
         Args:
             products_endpoint (str): S3 endpoint for file containing data for products, works for csv and json files
+            incremental (bool): upserts the products instead of replacing the table
+            resume (bool): uploads the cleaned snapshot from the staging area if the previous upload has failed
+    """
+    df_products_clean = extract_and_clean('dim_products',
+                                          lambda: new_data_extractor.extract_from_s3(products_endpoint),
+                                          lambda df: sharded_cleaner.clean(df, 'convert_product_weights', 'clean_products_data'),
+                                          resume)
+    if incremental and 'dim_products' in local_database_conn.list_db_tables():
+        # the Task 4 and Task 5 scripts may have added "weight_class" and renamed "removed" in the existing table
+        df_products_clean = data_cleaning.match_products_schema(df_products_clean,
+                                                                local_database_conn.get_table_columns('dim_products'))
+    load_dimension_table(df_products_clean, 'dim_products', ['product_code'], incremental)
+    staging.mark_loaded('dim_products')
+
+def stage_orders_data(chunk_size: int) -> None:
+    """
+    Streams orders_table in chunks to raw partitions in the staging area, then cleans one partition at a time
+    into cleaned partitions, so that only one partition is held in memory.
+
+        Args:
+            chunk_size (int): number of rows in each partition
     """
-    df_products_to_clean = new_data_extractor.extract_from_s3(products_endpoint)
-    df_clean_product_weights = data_cleaning.convert_product_weights(df_products_to_clean)
-    df_products_clean = data_cleaning.clean_products_data(df_clean_product_weights)
-    local_database_conn.upload_to_db(df_products_clean, 'dim_products')
+    staging.clear('orders_table')
+    df_orders_chunks = new_data_extractor.stream_rds_table(remote_database_conn, 'orders_table', chunk_size=chunk_size,
+                                                           dtype=ORDERS_TABLE_DTYPES, key_column='index')
+    for partition_number, df_orders_to_clean in enumerate(df_orders_chunks):
+        staging.write_partition('orders_table', 'raw', partition_number, df_orders_to_clean)
+    staging.mark_complete('orders_table', 'raw')
+
+    for partition_number, df_orders_to_clean in enumerate(staging.read_partitions('orders_table', 'raw')):
+        df_orders_clean = data_cleaning.clean_orders_data(df_orders_to_clean)
+        df_orders_clean = data_validator.validate(df_orders_clean, 'orders_table',
+                                                  if_exists='replace' if partition_number == 0 else 'append')
+        staging.write_partition('orders_table', 'clean', partition_number, df_orders_clean)
+    staging.mark_complete('orders_table', 'clean')
 
-def process_orders_data():
+def process_orders_data(chunk_size: int = 50000, incremental: bool = False, resume: bool = False) -> None:
     """
-    Retrieves, cleans and uploads data for orders.
+    Retrieves, cleans and uploads data for orders. The table is staged and cleaned in partitions (see stage_orders_data())
+    and uploaded one partition at a time.
+
+        Args:
+            chunk_size (int): number of rows retrieved, cleaned and uploaded at a time
+            incremental (bool): only loads orders added since the previous run and keeps the existing table
+            resume (bool): uploads the cleaned snapshot from the staging area if the previous upload has failed
     """
-    df_orders_to_clean = new_data_extractor.read_rds_table(remote_database_conn, 'orders_table')
-    df_orders_clean = data_cleaning.clean_orders_data(df_orders_to_clean)
-    local_database_conn.upload_to_db(df_orders_clean, 'orders_table')
+    if incremental:
+        load_incrementally('orders_table', 'orders_table', data_cleaning.clean_orders_data, ['index'], chunk_size=chunk_size,
+                           dtype=ORDERS_TABLE_DTYPES)
+        return
+    if resume and staging.can_resume('orders_table'):
+        print('Resuming orders_table from the cleaned snapshot.')
+    else:
+        stage_orders_data(chunk_size)
+    for partition_number, df_orders_clean in enumerate(staging.read_partitions('orders_table', 'clean')):
+        if_exists = 'replace' if partition_number == 0 else 'append'
+        local_database_conn.upload_to_db(df_orders_clean, 'orders_table', if_exists=if_exists)
+        local_database_conn.set_high_water_mark('orders_table', 'index', df_orders_clean['index'].max())
+    staging.mark_loaded('orders_table')
 
-def process_date_times_data(date_times_endpoint: str) -> None:
+def process_date_times_data(date_times_endpoint: str, incremental: bool = False, resume: bool = False) -> None:
     """
     Retrieves, cleans and uploads data for date times
     
         Args:
             date_times_endpoint (str): S3 endpoint for file containing date time data, works with json files
+            incremental (bool): upserts the date times instead of replacing the table
+            resume (bool): uploads the cleaned snapshot from the staging area if the previous upload has failed
     """
-    df_date_times_to_clean = pd.read_json(date_times_endpoint)
-    df_date_times_clean = data_cleaning.clean_date_times(df_date_times_to_clean)
-    local_database_conn.upload_to_db(df_date_times_clean, 'dim_date_times')
+    df_date_times_clean = extract_and_clean('dim_date_times',
+                                            lambda: new_data_extractor.retrieve_json_data(date_times_endpoint),
+                                            lambda df: sharded_cleaner.clean(df, 'clean_date_times'), resume)
+    load_dimension_table(df_date_times_clean, 'dim_date_times', ['date_uuid'], incremental)
+    staging.mark_loaded('dim_date_times')
+
+def process_reports(incremental: bool = False) -> None:
+    """
+    Refreshes the summary tables used by the business analysis reports. The summaries store the product prices and store
+    details of the orders they have counted, so they are only refreshed incrementally when none of the dimension tables
+    they join has been reloaded in the same run (see REPORT_DIMENSION_STAGES).
+
+        Args:
+            incremental (bool): only adds the orders loaded since the previous refresh instead of rebuilding the summaries
+    """
+    SalesReports(local_database_conn).refresh(full=not incremental)
 
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description='Extracts, cleans and uploads the retail data to the local database.')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_NAMES, default=STAGE_NAMES,
+                        help='stages to run, all stages are run by default')
+    parser.add_argument('--workers', type=int, default=4, help='maximum number of stages running at the same time')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only loads users and orders added since the previous run and upserts the other dimension '
+                             'tables, the tables are not replaced, so their keys are kept')
+    parser.add_argument('--pdf-workers', type=int, default=4, help='number of processes extracting pages of the card details pdf')
+    parser.add_argument('--clean-workers', type=int, default=None,
+                        help='number of processes cleaning partitions of large tables, the number of CPUs by default')
+    parser.add_argument('--cache-dir', default='.cache', help='directory for the local cache of remote data')
+    parser.add_argument('--cache-ttl', type=float, default=7 * 24 * 3600, help='number of seconds after which cached data expires')
+    parser.add_argument('--stores-checkpoint', default=os.path.join('.cache', 'stores_checkpoint.sqlite'),
+                        help='SQLite file recording every fetched store, a failed stores crawl resumes from it')
+    parser.add_argument('--api-rate', type=float, default=10, help='maximum number of requests per second sent to the stores API')
+    parser.add_argument('--resume', action='store_true',
+                        help='uploads the cleaned snapshots of tables whose previous upload has failed instead of extracting them again')
+    parser.add_argument('--staging-dir', default='staging', help='directory for the raw and cleaned snapshots of each table')
+    parser.add_argument('--profile-report', help='writes the time, rows and memory of every step to this file, '
+                                                 'in the Prometheus text format if it ends with .prom and as JSON otherwise')
+    parser.add_argument('--profile-stages', nargs='+', choices=STAGE_NAMES, default=[],
+                        help='stages captured with cProfile and tracemalloc, requires --profile-report')
+    args = parser.parse_args()
+
+    if args.profile_report:
+        profiler.enable(capture_stages=args.profile_stages, profile_dir=os.path.dirname(os.path.abspath(args.profile_report)))
+
     local_database_conn = DatabaseConnector('db_creds_local.yaml')  # file with credentials for local databse is passed to class instance
     remote_database_conn = DatabaseConnector('db_creds.yaml')       # file with credentials for remote databse is passed to class instance
-    new_data_extractor = DataExtractor()
+    data_cache = DataCache(args.cache_dir, ttl=args.cache_ttl)
+    os.makedirs(os.path.dirname(args.stores_checkpoint) or '.', exist_ok=True)
+    stores_checkpoint = CrawlCheckpoint(args.stores_checkpoint, max_age=args.cache_ttl)
+    new_data_extractor = DataExtractor(cache=data_cache, stores_checkpoint=stores_checkpoint)
     data_cleaning = DataCleaning()
-
-    process_user_data()
+    sharded_cleaner = ShardedCleaner(data_cleaning, max_workers=args.clean_workers)
+    staging = StagingArea(args.staging_dir)
+    data_validator = DataValidator(local_database_conn)
 
     card_details_endpoint = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf'
-    process_card_data(card_details_endpoint)
 
     st_endpoint = 'https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores'
     st_data_endpoint = 'https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/store_details/'
     load_dotenv('x_api_key.env')
     api_key = os.getenv('x-api-key')
-    process_stores_data(st_endpoint, st_data_endpoint, api_key)
 
     products_endpoint = 's3://data-handling-public/products.csv'
-    process_products_data(products_endpoint)
 
     date_times_endpoint = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json'
-    process_date_times_data(date_times_endpoint)
\ No newline at end of file
+
+    # stages without dependencies run concurrently, orders_table is loaded after all of its dimension tables
+    pipeline = Pipeline(max_workers=args.workers)
+    pipeline.add_stage(PipelineStage('users', process_user_data, incremental=args.incremental, resume=args.resume))
+    pipeline.add_stage(PipelineStage('cards', process_card_data, card_details_endpoint=card_details_endpoint,
+                                     pdf_workers=args.pdf_workers, incremental=args.incremental, resume=args.resume))
+    pipeline.add_stage(PipelineStage('stores', process_stores_data, st_endpoint=st_endpoint, st_data_endpoint=st_data_endpoint,
+                                     api_key=api_key, api_rate=args.api_rate, incremental=args.incremental, resume=args.resume))
+    pipeline.add_stage(PipelineStage('products', process_products_data, products_endpoint=products_endpoint,
+                                     incremental=args.incremental, resume=args.resume))
+    pipeline.add_stage(PipelineStage('date_times', process_date_times_data, date_times_endpoint=date_times_endpoint,
+                                     incremental=args.incremental, resume=args.resume))
+    pipeline.add_stage(PipelineStage('orders', process_orders_data, depends_on=('users', 'cards', 'stores', 'products', 'date_times'),
+                                     incremental=args.incremental, resume=args.resume))
+    pipeline.add_stage(PipelineStage('reports', process_reports, depends_on=('orders',),
+                                     incremental=args.incremental and not REPORT_DIMENSION_STAGES & set(args.stages)))
+
+    try:
+        pipeline.run(args.stages)
+    finally:
+        pipeline.print_timings()
+        print(f'Cache stats: {data_cache.stats}')
+        stores_checkpoint.close()
+        if args.profile_report:
+            profiler.write_report(args.profile_report)
+        for database_conn in (remote_database_conn, local_database_conn):
+            print(f'Connection stats: {database_conn.connection_stats}')
+            database_conn.close()
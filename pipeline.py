@@ -0,0 +1,115 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from instrumentation import profiler
+import time
+
+
+class PipelineStage:
+    """
+    A single stage of the pipeline, which extracts, cleans and uploads the data for one table.
+
+        Args:
+            name (str): unique name of the stage
+            process (callable): function running the extract, clean and load steps of the stage
+            depends_on (tuple): names of the stages that have to finish before this stage can start
+            kwargs: keyword arguments passed to the process function
+    """
+    def __init__(self, name: str, process, depends_on: tuple = (), **kwargs) -> None:
+        self.name = name
+        self.process = process
+        self.depends_on = tuple(depends_on)
+        self.kwargs = kwargs
+
+    def run(self) -> None:
+        """
+        Runs the process function of the stage with its keyword arguments.
+        """
+        self.process(**self.kwargs)
+
+
+class Pipeline:
+    """
+    Runs pipeline stages concurrently on a thread pool. A stage is started as soon as all the stages it depends on
+    have finished, stages without dependencies between them run at the same time.
+
+        Args:
+            max_workers (int): maximum number of stages running at the same time
+    """
+    def __init__(self, max_workers: int = 4) -> None:
+        self.max_workers = max_workers
+        self.stages = {}
+        self.timings = {}
+
+    def add_stage(self, stage: PipelineStage) -> None:
+        """
+        Registers a stage in the pipeline.
+
+        Args:
+            stage (PipelineStage): the stage to register
+        """
+        if stage.name in self.stages:
+            raise ValueError(f'Stage {stage.name} has already been added to the pipeline.')
+        self.stages[stage.name] = stage
+
+    def run(self, stage_names: list = None) -> dict:
+        """
+        Runs the selected stages, or all stages if none are selected. Dependencies on stages that have not been selected
+        are ignored, their tables are assumed to be loaded already. If a stage fails, no new stages are started and the
+        exception is raised once the running stages have finished.
+
+        Args:
+            stage_names (list): names of the stages to run
+        Returns:
+            timings (dict): wall time in seconds for each stage that has been run
+        """
+        if stage_names is None:
+            stage_names = list(self.stages)
+        unknown_stages = set(stage_names) - set(self.stages)
+        if unknown_stages:
+            raise ValueError(f'Unknown stages: {", ".join(sorted(unknown_stages))}')
+
+        pending = {name: set(self.stages[name].depends_on) & set(stage_names) for name in stage_names}
+        self.timings = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while pending or running:
+                # starts every stage whose dependencies have all finished
+                if error is None:
+                    for name in [name for name, dependencies in pending.items() if not dependencies]:
+                        del pending[name]
+                        running[executor.submit(self._run_stage, self.stages[name])] = name
+                if not running:
+                    if pending and error is None:
+                        raise ValueError(f'Circular dependency between stages: {", ".join(sorted(pending))}')
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    for dependencies in pending.values():
+                        dependencies.discard(name)
+
+        if error is not None:
+            raise error
+        return self.timings
+
+    def _run_stage(self, stage: PipelineStage) -> None:
+        """
+        Runs a single stage and records its wall time, the stage is also recorded by the profiler when it is enabled.
+        """
+        start = time.perf_counter()
+        try:
+            with profiler.stage(stage.name):
+                stage.run()
+        finally:
+            self.timings[stage.name] = time.perf_counter() - start
+
+    def print_timings(self) -> None:
+        """
+        Prints the wall time of each stage from the last run, slowest first.
+        """
+        for name, seconds in sorted(self.timings.items(), key=lambda item: item[1], reverse=True):
+            print(f'{name:<12} {seconds:>10.2f} s')
@@ -0,0 +1,147 @@
+from database_utils import DatabaseConnector
+from instrumentation import instrumented
+from sqlalchemy import text
+import pandas as pd
+
+
+@instrumented
+class SalesReports:
+    """
+    Maintains pre-aggregated summary tables for the business analysis queries, so that reports read a few rows instead of
+    joining and scanning orders_table every time. The sales summaries are refreshed incrementally with the orders added
+    since the previous refresh, the last included orders_table "index" is stored in the pipeline state table in the same
+    transaction as the summaries, so an interrupted refresh never counts the same orders twice.
+
+    Summary tables:
+        report_monthly_sales: total sales and number of sales per year and month (business analysis Tasks 3 and 6)
+        report_store_sales: total sales, number of sales and products sold per country and store type (Tasks 4, 5 and 8)
+        report_sale_gaps: total and number of gaps between consecutive sales per year (Task 9),
+            rebuilt on every refresh since dim_date_times is replaced on every load
+
+        Args:
+            db_connector_instance (DatabaseConnector): connector for the database holding the star schema
+    """
+    STATE_SOURCE = 'report:orders_table'
+
+    SUMMARY_TABLES = {
+        'report_monthly_sales': '''
+            CREATE TABLE IF NOT EXISTS report_monthly_sales (
+                year INTEGER, month INTEGER, total_sales NUMERIC, number_of_sales BIGINT,
+                PRIMARY KEY (year, month))''',
+        'report_store_sales': '''
+            CREATE TABLE IF NOT EXISTS report_store_sales (
+                country_code VARCHAR(2), store_type VARCHAR(255), total_sales NUMERIC, number_of_sales BIGINT,
+                product_quantity_count BIGINT,
+                PRIMARY KEY (country_code, store_type))''',
+        'report_sale_gaps': '''
+            CREATE TABLE IF NOT EXISTS report_sale_gaps (
+                year INTEGER PRIMARY KEY, total_gap_seconds DOUBLE PRECISION, number_of_gaps BIGINT)''',
+    }
+
+    MONTHLY_SALES_REFRESH = '''
+        INSERT INTO report_monthly_sales (year, month, total_sales, number_of_sales)
+        SELECT
+            EXTRACT(YEAR FROM dt.date_time)::integer,
+            EXTRACT(MONTH FROM dt.date_time)::integer,
+            SUM(ROUND(p.product_price::numeric, 2) * ot.product_quantity),
+            COUNT(*)
+        FROM orders_table AS ot
+        INNER JOIN dim_products AS p
+            ON ot.product_code = p.product_code
+        INNER JOIN dim_date_times AS dt
+            ON ot.date_uuid = dt.date_uuid
+        WHERE (CAST(:after AS BIGINT) IS NULL OR ot."index" > CAST(:after AS BIGINT)) AND ot."index" <= :until
+        GROUP BY 1, 2
+        ON CONFLICT (year, month) DO UPDATE SET
+            total_sales = report_monthly_sales.total_sales + EXCLUDED.total_sales,
+            number_of_sales = report_monthly_sales.number_of_sales + EXCLUDED.number_of_sales'''
+
+    STORE_SALES_REFRESH = '''
+        INSERT INTO report_store_sales (country_code, store_type, total_sales, number_of_sales, product_quantity_count)
+        SELECT
+            sd.country_code,
+            sd.store_type,
+            SUM(ROUND(p.product_price::numeric, 2) * ot.product_quantity),
+            COUNT(*),
+            SUM(ot.product_quantity)
+        FROM orders_table AS ot
+        INNER JOIN dim_products AS p
+            ON ot.product_code = p.product_code
+        INNER JOIN dim_store_details AS sd
+            ON ot.store_code = sd.store_code
+        WHERE (CAST(:after AS BIGINT) IS NULL OR ot."index" > CAST(:after AS BIGINT)) AND ot."index" <= :until
+        GROUP BY 1, 2
+        ON CONFLICT (country_code, store_type) DO UPDATE SET
+            total_sales = report_store_sales.total_sales + EXCLUDED.total_sales,
+            number_of_sales = report_store_sales.number_of_sales + EXCLUDED.number_of_sales,
+            product_quantity_count = report_store_sales.product_quantity_count + EXCLUDED.product_quantity_count'''
+
+    SALE_GAPS_REFRESH = '''
+        INSERT INTO report_sale_gaps (year, total_gap_seconds, number_of_gaps)
+        SELECT
+            year,
+            SUM(EXTRACT(EPOCH FROM next_time - date_time)),
+            COUNT(next_time)
+        FROM (
+            SELECT
+                EXTRACT(YEAR FROM date_time)::integer AS year,
+                date_time,
+                LEAD(date_time) OVER(ORDER BY date_time) AS next_time
+            FROM
+                dim_date_times
+        ) AS sales
+        GROUP BY year'''
+
+    def __init__(self, db_connector_instance: DatabaseConnector) -> None:
+        self.db_connector = db_connector_instance
+
+    def refresh(self, full: bool = False) -> None:
+        """
+        Adds the orders loaded since the previous refresh to the sales summaries and rebuilds the sale gaps summary.
+        A full refresh rebuilds every summary from all orders, which is needed after orders_table or the dimension
+        tables have been replaced.
+
+        Args:
+            full (bool): rebuilds the sales summaries from all orders
+        """
+        after = None if full else self.db_connector.get_high_water_mark(self.STATE_SOURCE)
+        engine = self.db_connector.init_db_engine()
+        with engine.begin() as conn:
+            for create_statement in self.SUMMARY_TABLES.values():
+                conn.execute(text(create_statement))
+            if after is None:
+                conn.execute(text('TRUNCATE report_monthly_sales, report_store_sales'))
+
+            until = conn.execute(text('SELECT MAX("index") FROM orders_table')).scalar()
+            if until is not None:
+                conn.execute(text(self.MONTHLY_SALES_REFRESH), {'after': after, 'until': until})
+                conn.execute(text(self.STORE_SALES_REFRESH), {'after': after, 'until': until})
+
+            conn.execute(text('TRUNCATE report_sale_gaps'))
+            conn.execute(text(self.SALE_GAPS_REFRESH))
+            if until is not None:
+                self.db_connector.set_high_water_mark(self.STATE_SOURCE, 'index', until, conn=conn)
+        self.db_connector.invalidate_table_cache()
+        print(f'Summary tables have been refreshed ({"full" if after is None else "incremental"}).')
+
+    def read_report(self, table_name: str) -> pd.DataFrame:
+        """
+        Reads one of the summary tables. The average time between sales per year is added to report_sale_gaps and the
+        share of total sales to report_store_sales.
+
+        Args:
+            table_name (str): name of the summary table
+        Returns:
+            df (pd.DataFrame): the rows of the summary table
+        """
+        if table_name not in self.SUMMARY_TABLES:
+            raise ValueError(f'Unknown summary table: {table_name}')
+        engine = self.db_connector.init_db_engine()
+        with engine.connect() as conn:
+            df = pd.read_sql_query(text(f'SELECT * FROM {table_name}'), conn)
+
+        if table_name == 'report_sale_gaps':
+            df['average_time_between_sales'] = pd.to_timedelta(df['total_gap_seconds'] / df['number_of_gaps'], unit='s')
+        elif table_name == 'report_store_sales':
+            df['percentage'] = (df['total_sales'].astype(float) / df['total_sales'].astype(float).sum() * 100).round(2)
+        return df
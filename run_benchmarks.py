@@ -0,0 +1,205 @@
+from baseline_cleaning import BaselineDataCleaning
+from data_cleaning import DataCleaning
+from data_extraction import DataExtractor
+from database_utils import DatabaseConnector
+from datetime import datetime, timezone
+from synthetic_data import StoresApiStub, SyntheticDataGenerator, write_table_pdf
+import argparse
+import json
+import os
+import platform
+import requests
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+
+class Benchmark:
+    """
+    Runs benchmarks and records their wall time and peak traced memory. The timed runs are made without tracemalloc,
+    which slows down allocations, and the memory is measured in one additional run.
+
+        Args:
+            repeat (int): number of timed runs, the fastest run is recorded
+            measure_memory (bool): measures the peak traced memory in an additional run
+    """
+    def __init__(self, repeat: int = 3, measure_memory: bool = True) -> None:
+        self.repeat = repeat
+        self.measure_memory = measure_memory
+        self.results = []
+
+    def measure(self, name: str, scale: int, function, make_input=lambda: ()) -> None:
+        """
+        Measures a function. A fresh input is created before each run, outside of the measured time, since the cleaning
+        methods modify their input in place.
+
+        Args:
+            name (str): name of the benchmark
+            scale (int): number of rows processed
+            function (callable): function to measure, called with the arguments returned by make_input
+            make_input (callable): function returning a tuple of arguments for each run
+        """
+        timings = []
+        for _ in range(self.repeat):
+            arguments = make_input()
+            start = time.perf_counter()
+            result = function(*arguments)
+            timings.append(time.perf_counter() - start)
+
+        peak_memory = None
+        if self.measure_memory:
+            arguments = make_input()
+            tracemalloc.start()
+            function(*arguments)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        record = {'benchmark': name, 'scale': scale, 'seconds': min(timings), 'peak_memory_bytes': peak_memory,
+                  'rows_out': len(result) if isinstance(result, pd.DataFrame) else None}
+        self.results.append(record)
+        print(f'{name:<45} {scale:>10} {record["seconds"]:>10.4f} s', flush=True)
+
+    def write_results(self, path: str) -> None:
+        """
+        Writes the results with the commit and library versions, so that results of different commits can be compared.
+
+        Args:
+            path (str): path of the JSON file
+        """
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        report = {'commit': commit, 'created': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(),
+                  'pandas': pd.__version__, 'results': self.results}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def benchmark_cleaning(benchmark: Benchmark, generator: SyntheticDataGenerator, scale: int) -> None:
+    """
+    Benchmarks every DataCleaning method on synthetic data, and the original implementations kept in
+    baseline_cleaning.py on the same data, as BaselineDataCleaning.<method>.
+    """
+    data_cleaning = DataCleaning()
+    baseline_data_cleaning = BaselineDataCleaning()
+    cases = [
+        ('clean_user_data', generator.user_data, data_cleaning.clean_user_data),
+        ('clean_card_data', generator.card_data, data_cleaning.clean_card_data),
+        ('clean_store_data', generator.store_data, data_cleaning.clean_store_data),
+        ('convert_product_weights', generator.product_data, data_cleaning.convert_product_weights),
+        ('clean_products_data', lambda n: data_cleaning.convert_product_weights(generator.product_data(n)),
+         data_cleaning.clean_products_data),
+        ('clean_orders_data', generator.orders_data, data_cleaning.clean_orders_data),
+        ('clean_date_times', generator.date_times_data, data_cleaning.clean_date_times),
+    ]
+    for name, make_data, method in cases:
+        df = make_data(scale)
+        benchmark.measure(f'DataCleaning.{name}', scale, method, lambda: (df.copy(),))
+        if hasattr(baseline_data_cleaning, name):
+            benchmark.measure(f'BaselineDataCleaning.{name}', scale, getattr(baseline_data_cleaning, name), lambda: (df.copy(),))
+
+
+def baseline_retrieve_stores_data(stores_data_endpoint: str, no_of_stores: int, header_dict: dict) -> pd.DataFrame:
+    """
+    The loop of DataExtractor.retrieve_stores_data() before it was optimised: one request per store sent serially without
+    a session, one single-row dataframe per store and a final pd.concat(). The check for a local df_stores.csv file and
+    writing it are left out, so that every run requests all stores.
+    """
+    df_list = []
+    for store_number in range(0, no_of_stores):
+        stores_data_endpoint_n = stores_data_endpoint + str(store_number)
+        response = requests.get(stores_data_endpoint_n, headers=header_dict)
+        data = response.json()
+        df = pd.DataFrame([data])
+        df_list.append(df)
+    df_store_data = pd.concat(df_list, ignore_index=True)
+    return df_store_data
+
+
+def benchmark_stores_api(benchmark: Benchmark, generator: SyntheticDataGenerator, scale: int, latency: float,
+                         failure_rate: float = 0.0) -> None:
+    """
+    Benchmarks retrieving all stores from a local stub of the stores API with the original serial loop and with the
+    StoresCrawler, serially and concurrently. The original loop does not retry failed requests and is only measured
+    without injected failures.
+    """
+    with StoresApiStub(generator.store_data(scale), latency=latency, failure_rate=failure_rate, seed=generator.seed) as api:
+        if failure_rate == 0:
+            benchmark.measure('baseline_retrieve_stores_data', scale,
+                              lambda: baseline_retrieve_stores_data(f'{api.url}/store_details/', scale, {}))
+        data_extractor = DataExtractor()
+        for max_workers in [1, 16]:
+            benchmark.measure(f'DataExtractor.retrieve_stores_data[workers={max_workers}]', scale,
+                              lambda: data_extractor.retrieve_stores_data(f'{api.url}/store_details/', scale, {},
+                                                                          max_workers=max_workers))
+
+
+def benchmark_pdf(benchmark: Benchmark, generator: SyntheticDataGenerator, scale: int, rows_per_page: int = 50) -> None:
+    """
+    Benchmarks extracting a generated multi-page card details pdf with an increasing number of worker processes.
+    Skipped if Java, which tabula runs on, is not installed.
+    """
+    if shutil.which('java') is None:
+        print('Java is not installed, the pdf benchmarks are skipped.')
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'card_details.pdf')
+        write_table_pdf(generator.card_data(scale), path, rows_per_page=rows_per_page)
+        data_extractor = DataExtractor()
+        for max_workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+            benchmark.measure(f'DataExtractor.retrieve_pdf_data[workers={max_workers}]', scale,
+                              lambda: data_extractor.retrieve_pdf_data(path, max_workers=max_workers))
+
+
+def benchmark_database(benchmark: Benchmark, generator: SyntheticDataGenerator, scale: int, db_creds: str) -> None:
+    """
+    Benchmarks uploading with COPY against the to_sql() insert methods, and streaming the table back, on a local Postgres.
+    """
+    table_name = 'benchmark_orders'
+    df = DataCleaning().clean_orders_data(generator.orders_data(scale))
+    with DatabaseConnector(db_creds) as database_conn:
+        engine = database_conn.init_db_engine()
+        benchmark.measure('DatabaseConnector.upload_to_db[copy]', scale,
+                          lambda: database_conn.upload_to_db(df, table_name))
+        for method in [None, 'multi']:
+            benchmark.measure(f'DataFrame.to_sql[method={method}]', scale,
+                              lambda: df.to_sql(table_name, engine, if_exists='replace', index=False, method=method,
+                                                chunksize=1000 if method == 'multi' else None))
+        data_extractor = DataExtractor()
+        benchmark.measure('DataExtractor.stream_rds_table', scale,
+                          lambda: pd.concat(data_extractor.stream_rds_table(database_conn, table_name)))
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS {table_name}')
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmarks the pipeline stages on seeded synthetic data.')
+    parser.add_argument('--scales', nargs='+', type=int, default=[450, 1000, 10000, 100000],
+                        help='numbers of rows to benchmark, 450 is the number of stores of the real API')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of each benchmark')
+    parser.add_argument('--no-memory', action='store_true', help='skips measuring the peak traced memory')
+    parser.add_argument('--api-latency', type=float, default=0.01, help='latency of the stub stores API in seconds')
+    parser.add_argument('--api-failure-rate', type=float, default=0.0, help='share of stub API requests failing with 503')
+    parser.add_argument('--max-api-stores', type=int, default=10000, help='largest number of stores retrieved from the stub API')
+    parser.add_argument('--max-pdf-rows', type=int, default=10000, help='largest number of rows extracted from a generated pdf')
+    parser.add_argument('--db-creds', help='credentials of a local Postgres database, upload benchmarks are skipped without it')
+    parser.add_argument('--output', default='bench_results.json', help='path of the JSON results file')
+    args = parser.parse_args()
+
+    generator = SyntheticDataGenerator(seed=args.seed)
+    benchmark = Benchmark(repeat=args.repeat, measure_memory=not args.no_memory)
+    for scale in args.scales:
+        benchmark_cleaning(benchmark, generator, scale)
+        if scale <= args.max_api_stores:
+            benchmark_stores_api(benchmark, generator, scale, args.api_latency, args.api_failure_rate)
+        if scale <= args.max_pdf_rows:
+            benchmark_pdf(benchmark, generator, scale)
+        if args.db_creds:
+            benchmark_database(benchmark, generator, scale, args.db_creds)
+    benchmark.write_results(args.output)
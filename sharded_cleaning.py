@@ -0,0 +1,136 @@
+from concurrent.futures import ProcessPoolExecutor
+from data_cleaning import DataCleaning
+from instrumentation import instrumented
+from pandas.api.types import CategoricalDtype, union_categoricals
+from staging import dataframe_to_arrow
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+def _to_ipc(df: pd.DataFrame) -> bytes:
+    """
+    Serialises a dataframe to Arrow IPC stream bytes, which are passed between processes without pickling each value.
+    """
+    table = dataframe_to_arrow(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _from_ipc(data: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+def _clean_partition(method_names: tuple, data: bytes) -> tuple:
+    """
+    Cleans one partition in a worker process with the DataCleaning methods, applied in the passed order.
+    Returns the cleaned partition and the rejected rows, serialised to Arrow IPC bytes.
+    """
+    data_cleaning = DataCleaning()
+    df = _from_ipc(data)
+    for method_name in method_names:
+        df = getattr(data_cleaning, method_name)(df)
+    rejected_rows = {column: _to_ipc(df_rejected) for column, df_rejected in data_cleaning.rejected_rows.items()}
+    return _to_ipc(df), rejected_rows
+
+
+def drop_duplicates(columns: list, reject_key: str = None):
+    """
+    Returns a reduce step removing rows with duplicated values in the passed columns, keeping the first row.
+
+    Args:
+        columns (list): columns identifying a row
+        reject_key (str): key under which the removed rows are added to the rejected_rows dictionary passed to the reduce step
+    Returns:
+        callable: function taking in a dataframe and the rejected_rows dictionary and returning a dataframe
+    """
+    def reduce(df: pd.DataFrame, rejected_rows: dict = None) -> pd.DataFrame:
+        duplicated = df.duplicated(subset=columns, keep='first').to_numpy()
+        if rejected_rows is not None and reject_key and duplicated.any():
+            previously_rejected = [rejected_rows[reject_key]] if reject_key in rejected_rows else []
+            rejected_rows[reject_key] = pd.concat(previously_rejected + [df[duplicated]])
+        return df[~duplicated]
+    return reduce
+
+
+def concat_partitions(partitions: list) -> pd.DataFrame:
+    """
+    Concatenates cleaned partitions. Categorical columns are converted to the union of the categories of all partitions
+    first, otherwise partitions with different categories would be concatenated to an object column.
+
+    Args:
+        partitions (list): cleaned dataframes with the same columns
+    Returns:
+        df (pd.DataFrame): all rows of the partitions, in the order of the partitions
+    """
+    categorical_columns = {column for df in partitions for column in df.columns if isinstance(df[column].dtype, CategoricalDtype)}
+    for column in categorical_columns:
+        categories = union_categoricals([df[column].astype('category') for df in partitions], ignore_order=True).categories
+        dtype = CategoricalDtype(categories)
+        partitions = [df.astype({column: dtype}) for df in partitions]
+    return pd.concat(partitions)
+
+
+@instrumented
+class ShardedCleaner:
+    """
+    Runs the DataCleaning methods on row partitions of a dataframe in a pool of processes, so that cleaning large tables
+    uses more than one core. The cleaning rules are row-local, each partition is cleaned independently and the partitions
+    are reassembled in their original order. Rules that need the whole table, such as removing duplicates, are run on the
+    reassembled dataframe as a separate reduce step.
+
+    Partitions are passed to and from the worker processes as Arrow IPC bytes. Tables smaller than two partitions
+    are cleaned in the current process, where starting the pool would take longer than the cleaning.
+
+        Args:
+            data_cleaning (DataCleaning): instance used in the current process and receiving the rejected rows of all partitions
+            max_workers (int): number of worker processes, the number of CPUs by default
+            min_partition_rows (int): minimum number of rows in a partition
+    """
+    def __init__(self, data_cleaning: DataCleaning, max_workers: int = None, min_partition_rows: int = 50000) -> None:
+        self.data_cleaning = data_cleaning
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_partition_rows = min_partition_rows
+
+    def clean(self, df: pd.DataFrame, *method_names, reduce=None) -> pd.DataFrame:
+        """
+        Cleans a dataframe with the passed DataCleaning methods, applied to every partition in the passed order.
+
+        Args:
+            df (pd.DataFrame): dataframe to clean
+            method_names (str): names of the DataCleaning methods, for example 'clean_user_data'
+            reduce (callable): function applied to the reassembled dataframe and the rejected_rows of data_cleaning,
+                for example drop_duplicates(['user_uuid'], reject_key='user_uuid')
+        Returns:
+            df (pd.DataFrame): cleaned dataframe
+        """
+        number_of_partitions = min(self.max_workers, len(df) // self.min_partition_rows)
+        if number_of_partitions < 2:
+            for method_name in method_names:
+                df = getattr(self.data_cleaning, method_name)(df)
+        else:
+            df = self._clean_in_parallel(df, method_names, number_of_partitions)
+        return reduce(df, self.data_cleaning.rejected_rows) if reduce else df
+
+    def _clean_in_parallel(self, df: pd.DataFrame, method_names: tuple, number_of_partitions: int) -> pd.DataFrame:
+        """
+        Splits the dataframe into row partitions, cleans them in the process pool and reassembles the results.
+        """
+        bounds = np.linspace(0, len(df), number_of_partitions + 1, dtype=int)
+        partitions = (_to_ipc(df.iloc[start:end]) for start, end in zip(bounds[:-1], bounds[1:]))
+
+        cleaned_partitions, rejected_rows = [], {}
+        # Workers are spawned, forking the pipeline's process while its thread pools are running can deadlock the child.
+        with ProcessPoolExecutor(max_workers=number_of_partitions, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for data, partition_rejected_rows in executor.map(_clean_partition, [method_names] * number_of_partitions, partitions):
+                cleaned_partitions.append(_from_ipc(data))
+                for column, rejected_data in partition_rejected_rows.items():
+                    rejected_rows.setdefault(column, []).append(_from_ipc(rejected_data))
+
+        for column, rejected_partitions in rejected_rows.items():
+            self.data_cleaning.rejected_rows[column] = pd.concat(rejected_partitions)
+        return concat_partitions(cleaned_partitions)
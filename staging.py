@@ -0,0 +1,151 @@
+from typing import Iterator
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+
+
+def dataframe_to_arrow(df: pd.DataFrame) -> pa.Table:
+    """
+    Converts a dataframe to an Arrow table, converting object columns with mixed types to strings if needed.
+
+    Args:
+        df (pd.DataFrame): the dataframe to convert
+    Returns:
+        pa.Table: the data of the dataframe, including its index
+    """
+    try:
+        return pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for column in df.select_dtypes(include='object').columns:
+            try:
+                pa.array(df[column], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        return pa.Table.from_pandas(df, preserve_index=True)
+
+
+class StagingArea:
+    """
+    Stores the raw and cleaned output of each pipeline stage as partitioned Arrow IPC files, so that a failed load can be
+    resumed from the cleaned snapshot without extracting and cleaning the data again. Partitions are read through memory
+    maps, only the partition being processed is held in memory, which allows cleaning tables larger than the memory.
+
+    Files are stored as <root_dir>/<table_name>/<phase>/part-<number>.arrow, where the phase is 'raw' or 'clean'.
+
+        Args:
+            root_dir (str): directory in which the snapshots are stored
+    """
+    COMPLETE_MARKER = '_COMPLETE'
+    LOADED_MARKER = '_LOADED'
+
+    def __init__(self, root_dir: str = 'staging') -> None:
+        self.root_dir = root_dir
+
+    def _path(self, table_name: str, *parts) -> str:
+        return os.path.join(self.root_dir, table_name, *parts)
+
+    def clear(self, table_name: str) -> None:
+        """
+        Removes all snapshots of a table.
+
+        Args:
+            table_name (str): name of the table
+        """
+        shutil.rmtree(self._path(table_name), ignore_errors=True)
+
+    def write_partition(self, table_name: str, phase: str, partition_number: int, df: pd.DataFrame) -> None:
+        """
+        Writes one partition of a snapshot as an uncompressed Arrow IPC file, which can be memory mapped when it is read.
+        Object columns with mixed types, which Arrow cannot store, are written as strings.
+
+        Args:
+            table_name (str): name of the table
+            phase (str): 'raw' or 'clean'
+            partition_number (int): number of the partition, partitions are read in the order of their numbers
+            df (pd.DataFrame): the data of the partition
+        """
+        os.makedirs(self._path(table_name, phase), exist_ok=True)
+        table = dataframe_to_arrow(df)
+        path = self._path(table_name, phase, f'part-{partition_number:05d}.arrow')
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def write(self, table_name: str, phase: str, df: pd.DataFrame) -> None:
+        """
+        Writes a complete snapshot consisting of a single partition.
+
+        Args:
+            table_name (str): name of the table
+            phase (str): 'raw' or 'clean'
+            df (pd.DataFrame): the data of the snapshot
+        """
+        shutil.rmtree(self._path(table_name, phase), ignore_errors=True)
+        self.write_partition(table_name, phase, 0, df)
+        self.mark_complete(table_name, phase)
+
+    def mark_complete(self, table_name: str, phase: str) -> None:
+        """
+        Marks a snapshot as complete, once all of its partitions have been written.
+
+        Args:
+            table_name (str): name of the table
+            phase (str): 'raw' or 'clean'
+        """
+        os.makedirs(self._path(table_name, phase), exist_ok=True)
+        open(self._path(table_name, phase, self.COMPLETE_MARKER), 'w').close()
+
+    def mark_loaded(self, table_name: str) -> None:
+        """
+        Marks the cleaned snapshot of a table as uploaded to the database.
+
+        Args:
+            table_name (str): name of the table
+        """
+        open(self._path(table_name, self.LOADED_MARKER), 'w').close()
+
+    def can_resume(self, table_name: str) -> bool:
+        """
+        Checks if the table has a complete cleaned snapshot which has not been uploaded yet.
+
+        Args:
+            table_name (str): name of the table
+        Returns:
+            bool: True if the upload can be resumed from the cleaned snapshot
+        """
+        return (os.path.isfile(self._path(table_name, 'clean', self.COMPLETE_MARKER))
+                and not os.path.isfile(self._path(table_name, self.LOADED_MARKER)))
+
+    def read_partitions(self, table_name: str, phase: str) -> Iterator[pd.DataFrame]:
+        """
+        Reads the partitions of a snapshot one at a time. The files are memory mapped, so the Arrow data is not copied
+        into memory before it is converted to a dataframe.
+
+        Args:
+            table_name (str): name of the table
+            phase (str): 'raw' or 'clean'
+        Yields:
+            df (pd.DataFrame): the data of the next partition
+        """
+        directory = self._path(table_name, phase)
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.arrow'):
+                continue
+            # the memory map stays open for as long as the dataframe references its buffers
+            source = pa.memory_map(os.path.join(directory, file_name), 'r')
+            table = pa.ipc.open_file(source).read_all()
+            yield table.to_pandas(split_blocks=True)
+
+    def read(self, table_name: str, phase: str) -> pd.DataFrame:
+        """
+        Reads all partitions of a snapshot to one dataframe.
+
+        Args:
+            table_name (str): name of the table
+            phase (str): 'raw' or 'clean'
+        Returns:
+            df (pd.DataFrame): the data of the snapshot
+        """
+        return pd.concat(self.read_partitions(table_name, phase))
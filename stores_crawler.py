@@ -0,0 +1,171 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import sqlite3
+import threading
+import time
+from urllib3.util.retry import Retry
+import pandas as pd
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the rate of requests sent to an API. Tokens are added continuously at the passed rate,
+    up to the capacity of the bucket, and every request takes one token, waiting until a token is available.
+
+        Args:
+            rate (float): number of requests allowed per second
+            capacity (int): maximum number of requests sent in a burst, the rate rounded up by default
+    """
+    def __init__(self, rate: float, capacity: int = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate + 0.5))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Takes one token from the bucket, blocking until a token is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedRetry(Retry):
+    """
+    urllib3 retry policy taking a token from a token bucket before every retry, so that retried requests count towards
+    the same API quota as the first attempts.
+
+        Args:
+            rate_limiter (TokenBucket): bucket shared with the first attempts, retries are not limited if None
+            **kwargs: arguments of urllib3.util.retry.Retry
+    """
+    def __init__(self, *args, rate_limiter: TokenBucket = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+
+    def new(self, **kwargs) -> 'RateLimitedRetry':
+        retry = super().new(**kwargs)
+        retry.rate_limiter = self.rate_limiter
+        return retry
+
+    def sleep(self, response=None) -> None:
+        super().sleep(response)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+
+class CrawlCheckpoint:
+    """
+    Durable record of the stores fetched from the API, kept in a local SQLite database. Every store is committed as soon as
+    it has been fetched, so that a crawl interrupted by a failure resumes with the stores that are still missing.
+    Stores fetched longer than max_age seconds ago are treated as stale and fetched again.
+
+        Args:
+            path (str): path of the SQLite database file, ':memory:' keeps the checkpoint for the lifetime of the instance only
+            max_age (float): number of seconds after which a fetched store is stale, stores never become stale if None
+    """
+    def __init__(self, path: str = ':memory:', max_age: float = None) -> None:
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS stores (
+                    endpoint TEXT, store_number INTEGER, data TEXT, fetched_at REAL,
+                    PRIMARY KEY (endpoint, store_number))''')
+
+    def fresh_stores(self, endpoint: str, no_of_stores: int) -> dict:
+        """
+        Returns the stores below the passed number of stores that have been fetched and are not stale.
+
+        Args:
+            endpoint (str): the endpoint URL for retrieving store data
+            no_of_stores (int): the current number of stores reported by the API
+        Returns:
+            dict: store data keyed by store number
+        """
+        oldest = None if self.max_age is None else time.time() - self.max_age
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT store_number, data FROM stores
+                WHERE endpoint = ? AND store_number < ? AND (? IS NULL OR fetched_at >= ?)''',
+                (endpoint, no_of_stores, oldest, oldest)).fetchall()
+        return {store_number: json.loads(data) for store_number, data in rows}
+
+    def save(self, endpoint: str, store_number: int, data: dict) -> None:
+        """
+        Commits the data of one fetched store.
+
+        Args:
+            endpoint (str): the endpoint URL for retrieving store data
+            store_number (int): the number of the store
+            data (dict): store data as returned by the API
+        """
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO stores VALUES (?, ?, ?, ?)',
+                               (endpoint, store_number, json.dumps(data), time.time()))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class StoresCrawler:
+    """
+    Fetches the details of every store from the API, resuming from a checkpoint. Only stores that are missing from the
+    checkpoint or stale are requested, so a crawl that failed part way, or a crawl after the number of stores has changed,
+    only fetches the remaining stores. Requests are sent concurrently and limited by a token bucket to the API quota.
+
+        Args:
+            checkpoint (CrawlCheckpoint): record of the fetched stores
+            requests_per_second (float): maximum rate of requests sent to the API, the rate is not limited if None
+            max_workers (int): maximum number of concurrent requests sent to the API
+    """
+    def __init__(self, checkpoint: CrawlCheckpoint, requests_per_second: float = None, max_workers: int = 16) -> None:
+        self.checkpoint = checkpoint
+        self.rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+        self.max_workers = max_workers
+
+    def crawl(self, endpoint: str, no_of_stores: int, fetch_store) -> pd.DataFrame:
+        """
+        Fetches the stores missing from the checkpoint and returns all stores. If a request fails, the requests that have
+        not been sent yet are cancelled and the error is raised, the stores fetched so far stay in the checkpoint.
+
+        Args:
+            endpoint (str): the endpoint URL for retrieving store data, identifies the stores in the checkpoint
+            no_of_stores (int): the total number of stores
+            fetch_store (callable): function taking a store number and returning the store data as a dictionary
+        Returns:
+            df (pd.Dataframe): a dataframe with one row per store, in the order of store numbers
+        """
+        stores = self.checkpoint.fresh_stores(endpoint, no_of_stores)
+        missing_store_numbers = [store_number for store_number in range(no_of_stores) if store_number not in stores]
+        if stores:
+            print(f'{len(stores)} of {no_of_stores} stores have been restored from the checkpoint.')
+
+        def fetch_and_save(store_number: int) -> None:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            data = fetch_store(store_number)
+            self.checkpoint.save(endpoint, store_number, data)
+            stores[store_number] = data
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(fetch_and_save, store_number) for store_number in missing_store_numbers]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return pd.DataFrame([stores[store_number] for store_number in range(no_of_stores)])
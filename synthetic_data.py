@@ -0,0 +1,278 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pypdf import PageObject, PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+import json
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+
+
+class SyntheticDataGenerator:
+    """
+    Generates seeded synthetic versions of the project's data sources, including the incorrect entries handled by
+    DataCleaning: 'NULL' strings, rows of 10 character garbage, 'GGB' country codes, '@@' in emails, '?' in card numbers,
+    multiplied weights such as '12 x 100g', mixed date formats, 'eeEurope' continents and letters in staff numbers.
+
+        Args:
+            seed (int): seed of the random number generator, the same seed always generates the same data
+            error_rate (float): share of rows replaced with 'NULL' rows or rows of garbage
+    """
+    COUNTRY_CODES = ['GB', 'DE', 'US']
+    COUNTRIES = {'GB': 'United Kingdom', 'DE': 'Germany', 'US': 'United States'}
+    CONTINENTS = {'GB': 'Europe', 'DE': 'Europe', 'US': 'America'}
+    STORE_TYPES = ['Local', 'Super Store', 'Mall Kiosk', 'Outlet', 'Web Portal']
+    CARD_PROVIDERS = ['VISA 16 digit', 'Mastercard', 'American Express', 'Discover', 'JCB 16 digit']
+    CATEGORIES = ['toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty', 'food-and-drink', 'diy']
+    TIME_PERIODS = ['Morning', 'Midday', 'Evening', 'Late_Hours']
+
+    def __init__(self, seed: int = 0, error_rate: float = 0.01) -> None:
+        self.seed = seed
+        self.error_rate = error_rate
+
+    def _rng(self, table_name: str) -> np.random.Generator:
+        # each table has its own stream, so adding a table does not change the data of the others
+        return np.random.default_rng([self.seed, sum(table_name.encode())])
+
+    def _uuids(self, rng: np.random.Generator, n: int) -> list:
+        return [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n)]
+
+    def _codes(self, rng: np.random.Generator, n: int, length: int = 10) -> np.ndarray:
+        characters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'))
+        return np.array([''.join(row) for row in rng.choice(characters, size=(n, length))])
+
+    def _dates(self, rng: np.random.Generator, n: int, start: str, end: str, mixed: bool = True) -> np.ndarray:
+        days = rng.integers(0, (pd.Timestamp(end) - pd.Timestamp(start)).days, n)
+        dates = pd.Timestamp(start) + pd.to_timedelta(days, unit='D')
+        formatted = np.array(dates.strftime('%Y-%m-%d'), dtype=object)
+        if mixed:
+            # a small share of dates in other formats, parsed by the format='mixed' fallback
+            other_format = rng.random(n) < 0.05
+            formatted[other_format] = np.array(dates[other_format].strftime('%Y %B %d'), dtype=object)
+        return formatted
+
+    def _add_errors(self, rng: np.random.Generator, df: pd.DataFrame, columns: list) -> pd.DataFrame:
+        """
+        Replaces a share of the rows with 'NULL' rows and rows of 10 character garbage in the passed columns.
+        """
+        n = len(df)
+        error_rows = np.flatnonzero(rng.random(n) < self.error_rate)
+        null_rows, garbage_rows = error_rows[::2], error_rows[1::2]
+        df.loc[df.index[null_rows], columns] = 'NULL'
+        for column in columns:
+            df.loc[df.index[garbage_rows], column] = self._codes(rng, len(garbage_rows))
+        return df
+
+    def user_data(self, n: int) -> pd.DataFrame:
+        rng = self._rng('legacy_users')
+        country_codes = rng.choice(self.COUNTRY_CODES, n)
+        first_names = rng.choice(['Sigfried', 'Guy', 'Harry', 'Darren', 'Emily', 'Anna'], n)
+        last_names = rng.choice(['Noack', 'Allen', 'Lawrence', 'Hussain', 'Smith', 'Becker'], n)
+        emails = np.char.add(np.char.add(np.char.lower(first_names.astype(str)), rng.choice(['@', '@@'], n, p=[0.95, 0.05])),
+                             'example.org')
+        country_codes_dirty = np.where((country_codes == 'GB') & (rng.random(n) < 0.05), 'GGB', country_codes)
+        df = pd.DataFrame({
+            'index': np.arange(n),
+            'first_name': first_names,
+            'last_name': last_names,
+            'date_of_birth': self._dates(rng, n, '1940-01-01', '2006-01-01'),
+            'company': rng.choice(['Heydrich Junitz KG', 'Twiss GmbH', 'Morgan Ltd', 'Barnes-Reid'], n),
+            'email_address': emails,
+            'address': np.char.add(rng.integers(1, 200, n).astype(str), ' High Street\nLondon'),
+            'country': [self.COUNTRIES[code] for code in country_codes],
+            'country_code': country_codes_dirty,
+            'phone_number': np.char.add('+44 (0)', rng.integers(1000000000, 9999999999, n).astype(str)),
+            'join_date': self._dates(rng, n, '1992-01-01', '2022-06-01'),
+            'user_uuid': self._uuids(rng, n),
+        }).astype(object).astype({'index': 'int64'})
+        return self._add_errors(rng, df, [column for column in df.columns if column != 'index'])
+
+    def card_data(self, n: int) -> pd.DataFrame:
+        rng = self._rng('card_details')
+        card_numbers = rng.integers(10 ** 15, 10 ** 16 - 1, n).astype(str).astype(object)
+        question_marks = rng.random(n) < 0.02
+        card_numbers[question_marks] = np.char.add('???', card_numbers[question_marks].astype(str))
+        expiry = pd.to_datetime(self._dates(rng, n, '2022-01-01', '2032-01-01', mixed=False))
+        df = pd.DataFrame({
+            'card_number': card_numbers,
+            'expiry_date': expiry.strftime('%m/%y'),
+            'card_provider': rng.choice(self.CARD_PROVIDERS, n),
+            'date_payment_confirmed': self._dates(rng, n, '1992-01-01', '2022-06-01'),
+        }).astype(object)
+        return self._add_errors(rng, df, list(df.columns))
+
+    def store_data(self, n: int) -> pd.DataFrame:
+        rng = self._rng('store_details')
+        country_codes = rng.choice(self.COUNTRY_CODES, n)
+        continents = np.array([self.CONTINENTS[code] for code in country_codes], dtype=object)
+        continents = np.where(rng.random(n) < 0.05, np.char.add('ee', continents.astype(str)), continents)
+        staff_numbers = rng.integers(1, 200, n).astype(str).astype(object)
+        letters = rng.random(n) < 0.02
+        staff_numbers[letters] = np.char.add('J', staff_numbers[letters].astype(str))
+        df = pd.DataFrame({
+            'index': np.arange(n),
+            'address': np.char.add(rng.integers(1, 200, n).astype(str), ' Market Street\nLeeds'),
+            'longitude': rng.uniform(-10, 20, n).round(5).astype(str),
+            'lat': None,
+            'locality': rng.choice(['Leeds', 'Berlin', 'Chapletown', 'High Wycombe'], n),
+            'store_code': np.char.add('BL-', self._codes(rng, n, 8)),
+            'staff_numbers': staff_numbers,
+            'opening_date': self._dates(rng, n, '1990-01-01', '2022-01-01'),
+            'store_type': rng.choice(self.STORE_TYPES, n),
+            'latitude': rng.uniform(40, 60, n).round(5).astype(str),
+            'country_code': country_codes,
+            'continent': continents,
+        }).astype(object).astype({'index': 'int64'})
+        return self._add_errors(rng, df, ['address', 'longitude', 'locality', 'store_code', 'staff_numbers', 'opening_date',
+                                          'store_type', 'latitude', 'country_code', 'continent'])
+
+    def product_data(self, n: int) -> pd.DataFrame:
+        rng = self._rng('products')
+        weight_formats = rng.integers(0, 6, n)
+        values = rng.integers(1, 1000, n).astype(str)
+        weights = np.select(
+            [weight_formats == 0, weight_formats == 1, weight_formats == 2, weight_formats == 3, weight_formats == 4],
+            [np.char.add(np.char.add(rng.integers(2, 16, n).astype(str), ' x '), np.char.add(values, 'g')),
+             np.char.add(values, 'g'), np.char.add(values, 'ml'), np.char.add(rng.integers(1, 40, n).astype(str), 'oz'),
+             np.char.add((rng.integers(1, 400, n) / 10).astype(str), 'kg')],
+            # the only entry with a trailing dot in the products data
+            '77g .')
+        df = pd.DataFrame({
+            'product_name': rng.choice(['FurReal Dazzlin Dimples', 'Tiffany Mirror', 'Coffee Table', 'Garden Hose'], n),
+            'product_price': np.char.add('£', (rng.integers(100, 100000, n) / 100).astype(str)),
+            'weight': weights,
+            'category': rng.choice(self.CATEGORIES, n),
+            'EAN': rng.integers(10 ** 12, 10 ** 13 - 1, n).astype(str),
+            'date_added': self._dates(rng, n, '2000-01-01', '2022-06-01'),
+            'uuid': self._uuids(rng, n),
+            'removed': rng.choice(['Still_avaliable', 'Removed'], n),
+            'product_code': np.char.add('R7-', self._codes(rng, n, 7)),
+        }).astype(object)
+        df = self._add_errors(rng, df, list(df.columns))
+        # NULL rows are read as missing values from the products csv file
+        return df.replace('NULL', np.nan)
+
+    def orders_data(self, n: int) -> pd.DataFrame:
+        rng = self._rng('orders_table')
+        return pd.DataFrame({
+            'level_0': np.arange(n),
+            'index': np.arange(n),
+            'date_uuid': self._uuids(rng, n),
+            'first_name': None,
+            'last_name': None,
+            'user_uuid': self._uuids(rng, n),
+            'card_number': rng.integers(10 ** 15, 10 ** 16 - 1, n).astype(str),
+            'store_code': np.char.add('BL-', self._codes(rng, n, 8)),
+            'product_code': np.char.add('R7-', self._codes(rng, n, 7)),
+            '1': None,
+            'product_quantity': rng.integers(1, 14, n),
+        })
+
+    def date_times_data(self, n: int) -> pd.DataFrame:
+        rng = self._rng('date_details')
+        df = pd.DataFrame({
+            'timestamp': [f'{h:02d}:{m:02d}:{s:02d}' for h, m, s in rng.integers(0, [24, 60, 60], (n, 3))],
+            'month': rng.integers(1, 13, n).astype(str),
+            'year': rng.integers(1992, 2023, n).astype(str),
+            'day': rng.integers(1, 29, n).astype(str),
+            'time_period': rng.choice(self.TIME_PERIODS, n),
+            'date_uuid': self._uuids(rng, n),
+        }).astype(object)
+        return self._add_errors(rng, df, list(df.columns))
+
+
+def write_table_pdf(df: pd.DataFrame, path: str, rows_per_page: int = 50) -> None:
+    """
+    Writes a dataframe to a pdf file as a text table with a header row on every page, in the layout of the card details pdf.
+
+    Args:
+        df (pd.DataFrame): table written to the pdf file
+        path (str): path of the pdf file
+        rows_per_page (int): number of table rows on each page
+    """
+    page_width, page_height, font_size = 842, 595, 8
+    column_width = (page_width - 60) / len(df.columns)
+    font = DictionaryObject({NameObject('/Type'): NameObject('/Font'), NameObject('/Subtype'): NameObject('/Type1'),
+                             NameObject('/BaseFont'): NameObject('/Helvetica')})
+
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    writer = PdfWriter()
+    rows = df.astype(str).values.tolist()
+    for start in range(0, max(len(rows), 1), rows_per_page):
+        lines = []
+        for row_number, row in enumerate([list(df.columns)] + rows[start:start + rows_per_page]):
+            y = page_height - 40 - row_number * (font_size + 2)
+            for column_number, value in enumerate(row):
+                lines.append(f'BT /F1 {font_size} Tf {30 + column_number * column_width:.1f} {y} Td ({escape(value)}) Tj ET')
+        content = DecodedStreamObject()
+        content.set_data('\n'.join(lines).encode('latin-1', errors='replace'))
+        page = PageObject.create_blank_page(width=page_width, height=page_height)
+        page[NameObject('/Resources')] = DictionaryObject({NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+        page.replace_contents(content)
+        writer.add_page(page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+class StoresApiStub:
+    """
+    Local HTTP server imitating the stores API, serving synthetic store details with a fixed latency per request.
+    A share of the requests can fail with 503 responses, which the stores crawl retries. The time at which each request
+    was received is recorded in request_times.
+
+        Args:
+            df_stores (pd.DataFrame): store details served by the API, one row per store number
+            latency (float): number of seconds each response is delayed by
+            failure_rate (float): share of requests answered with 503 Service Unavailable
+            seed (int): seed of the injected failures
+    """
+    def __init__(self, df_stores: pd.DataFrame, latency: float = 0.01, failure_rate: float = 0.0, seed: int = 0) -> None:
+        stores = json.loads(df_stores.to_json(orient='records'))
+        number_of_stores = len(stores)
+        rng = np.random.default_rng(seed)
+        rng_lock = threading.Lock()
+        request_times = self.request_times = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are sent in separate writes, with Nagle's algorithm the body of a response on a kept-alive
+            # connection would wait for the delayed acknowledgement of the headers
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with rng_lock:
+                    request_times.append(time.monotonic())
+                    failed = rng.random() < failure_rate
+                time.sleep(latency)
+                if failed:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if self.path == '/number_stores':
+                    body = {'number_stores': number_of_stores}
+                else:
+                    body = stores[int(self.path.rsplit('/', 1)[-1])]
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,100 @@
+from baseline_cleaning import BaselineDataCleaning
+from data_cleaning import DataCleaning
+from synthetic_data import SyntheticDataGenerator
+import pandas as pd
+import pytest
+
+
+SEEDS = [0, 1, 2]
+
+
+def generator(seed: int) -> SyntheticDataGenerator:
+    return SyntheticDataGenerator(seed=seed, error_rate=0.05)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_clean_user_data_matches_baseline(seed):
+    expected = BaselineDataCleaning().clean_user_data(generator(seed).user_data(2000))
+    result = DataCleaning().clean_user_data(generator(seed).user_data(2000))
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_clean_card_data_matches_baseline(seed):
+    expected = BaselineDataCleaning().clean_card_data(generator(seed).card_data(2000))
+    result = DataCleaning().clean_card_data(generator(seed).card_data(2000))
+
+    # intended differences: the baseline converted these columns without assigning the results
+    expected['date_payment_confirmed'] = pd.to_datetime(expected['date_payment_confirmed'], format='mixed', errors='coerce')
+    expected['card_provider'] = expected['card_provider'].astype('category')
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_clean_card_data_converts_payment_dates_and_providers():
+    df = pd.DataFrame({
+        'card_number': ['4971858637664481', '?3554954842403145', 'NULL'],
+        'expiry_date': ['09/26', '10/23', 'NULL'],
+        'card_provider': ['VISA 16 digit', 'JCB 16 digit', 'NULL'],
+        'date_payment_confirmed': ['2015-11-25', '2017 October 10', 'NULL'],
+    })
+    result = DataCleaning().clean_card_data(df)
+
+    assert result['card_number'].tolist() == ['4971858637664481', '3554954842403145']
+    assert result['expiry_date'].tolist() == [pd.Timestamp('2026-09-30'), pd.Timestamp('2023-10-31')]
+    assert result['date_payment_confirmed'].tolist() == [pd.Timestamp('2015-11-25'), pd.Timestamp('2017-10-10')]
+    assert isinstance(result['card_provider'].dtype, pd.CategoricalDtype)
+
+
+def test_clean_user_data_keeps_rejected_rows():
+    data_cleaning = DataCleaning()
+    df = generator(0).user_data(500)
+    result = data_cleaning.clean_user_data(df.copy())
+
+    rejected = data_cleaning.rejected_rows['user_uuid']
+    assert len(result) + len(rejected) == len(df)
+    # the rejected rows keep their original entries
+    assert rejected['user_uuid'].isin(df['user_uuid']).all()
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_convert_product_weights_matches_baseline(seed):
+    expected = BaselineDataCleaning().convert_product_weights(generator(seed).product_data(2000))
+    result = DataCleaning().convert_product_weights(generator(seed).product_data(2000))
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_convert_product_weights_examples():
+    df = pd.DataFrame({'weight': ['12 x 100g', '77g .', '16oz', '500ml', '1.5kg', '3 x 2.5g', 'ABCDEFGH12', None]})
+    result = DataCleaning().convert_product_weights(df)
+
+    assert result['weight'].tolist() == pytest.approx([1.2, 0.077, 0.4536, 0.5, 1.5, 0.0075])
+
+
+def test_convert_product_weights_converts_decimal_grams():
+    # intended difference: the baseline only converted grams without a decimal point and returned these weights unchanged
+    df = pd.DataFrame({'weight': ['12.5g', '1.2g']})
+    expected = BaselineDataCleaning().convert_product_weights(df.copy())
+    result = DataCleaning().convert_product_weights(df.copy())
+
+    assert expected['weight'].tolist() == [12.5, 1.2]
+    assert result['weight'].tolist() == pytest.approx([0.0125, 0.0012])
+
+
+def test_match_products_schema_applies_task_4_and_5_changes():
+    df = pd.DataFrame({
+        'product_code': ['a1', 'b2', 'c3', 'd4', 'e5'],
+        'weight': [0.5, 2.0, 40.0, 140.0, None],
+        'removed': pd.Categorical(['Still_available', 'Removed', None, 'Still_available', 'Removed']),
+    })
+    result = DataCleaning().match_products_schema(df, ['product_code', 'weight', 'still_available', 'weight_class'])
+
+    assert sorted(result.columns) == ['product_code', 'still_available', 'weight', 'weight_class']
+    assert result['weight_class'].tolist() == ['Light', 'Mid_Sized', 'Heavy', 'Truck_Required', None]
+    # as in the Task 5 script, only 'Removed' products are unavailable
+    assert result['still_available'].tolist() == [True, False, True, True, False]
+
+
+def test_match_products_schema_keeps_original_columns():
+    df = pd.DataFrame({'weight': [1.0], 'removed': ['Removed']})
+    result = DataCleaning().match_products_schema(df.copy(), ['weight', 'removed'])
+    pd.testing.assert_frame_equal(result, df)
@@ -0,0 +1,36 @@
+from database_utils import DatabaseConnector
+from io import StringIO
+import datetime
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def database_conn(tmp_path, monkeypatch):
+    creds = tmp_path / 'db_creds.yaml'
+    creds.write_text('RDS_HOST: localhost\nRDS_USER: user\nRDS_PASSWORD: password\nRDS_DATABASE: sales_data\nRDS_PORT: 5432\n')
+    database_conn = DatabaseConnector(str(creds))
+    monkeypatch.setattr(database_conn, 'list_db_tables', lambda refresh=False: ['dim_products'])
+    monkeypatch.setattr(database_conn, 'get_table_columns',
+                        lambda table_name: ['product_code', 'weight', 'still_available', 'weight_class'])
+    return database_conn
+
+
+def test_upsert_to_db_rejects_columns_not_matching_the_table(database_conn):
+    df = pd.DataFrame({'product_code': ['a1'], 'weight': [1.0], 'removed': ['Removed']})
+    with pytest.raises(ValueError, match=r"missing \['still_available', 'weight_class'\], not in the table \['removed'\]"):
+        database_conn.upsert_to_db(df, 'dim_products', ['product_code'])
+
+
+def test_copy_csv_keeps_empty_text_apart_from_missing_values():
+    buffer = StringIO()
+    DatabaseConnector.write_copy_csv(buffer, [('a', None, '', 1.5), ('b,c', 2, None, datetime.date(2022, 9, 1))])
+
+    assert buffer.getvalue() == 'a,\\N,,1.5\r\n"b,c",2,\\N,2022-09-01\r\n'
+
+
+def test_copy_csv_quotes_text_equal_to_the_null_marker():
+    buffer = StringIO()
+    DatabaseConnector.write_copy_csv(buffer, [('\\N', None, 'say "hi"', 3)])
+
+    assert buffer.getvalue() == '"\\N",\\N,"say ""hi""","3"\r\n'
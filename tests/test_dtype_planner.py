@@ -0,0 +1,49 @@
+from dtype_planner import DtypePlanner
+from sqlalchemy.types import BigInteger, Float, SmallInteger
+import numpy as np
+import pandas as pd
+
+
+def test_numeric_columns_are_downcast_in_memory_only():
+    df = pd.DataFrame({
+        'index': [1, 2, 300],
+        'product_quantity': [1, 2, 3],
+        'product_price': [12.99, 1.5, np.nan],
+        'weight': [1.5, 0.25, np.nan],
+    })
+    plan = DtypePlanner().plan(df)
+
+    assert plan['index']['dtype'] == np.int16 and isinstance(plan['index']['sql_type'], BigInteger)
+    assert plan['product_quantity']['dtype'] == np.int8 and isinstance(plan['product_quantity']['sql_type'], SmallInteger)
+    # single precision would round the price, the weights are stored exactly
+    assert plan['product_price']['dtype'] == np.float64
+    assert plan['weight']['dtype'] == np.float32
+    assert all(plan[column]['sql_type'].precision == 53 for column in ['product_price', 'weight'])
+
+    result = DtypePlanner().apply(df, plan)
+    pd.testing.assert_frame_equal(result, df, check_dtype=False)
+
+
+def test_coordinates_are_planned_as_float():
+    df = pd.DataFrame({'longitude': [-0.12, np.nan], 'latitude': [51.5, np.nan], 'staff_numbers': [12, np.nan]})
+    sql_types = DtypePlanner().sql_types(DtypePlanner().plan(df))
+
+    assert all(isinstance(sql_types[column], Float) for column in ['longitude', 'latitude'])
+    # integers with missing values are floats, which a SMALLINT column would not accept
+    assert isinstance(sql_types['staff_numbers'], Float)
+
+
+def test_converted_dataframe_is_planned_with_the_same_sql_types():
+    # the pipeline converts the cleaned data after cleaning, upload_to_db() plans the SQL types of the converted data
+    df = pd.DataFrame({
+        'user_uuid': ['93caf182-e4e9-4c6e-bebb-60a1a9dcf9b8', 'a1c2f5e7-4d2b-4b9e-9d3a-2e6f8c1b7a90', None],
+        'country_code': ['GB', 'GB', 'US'],
+        'address': ['1 High Street', '2 Low Road', '3 Main Street'],
+        'index': [0, 1, 2],
+        'opening_date': pd.to_datetime(['2010-01-01', '2011-05-02', None]),
+    })
+    planner = DtypePlanner(category_ratio=0.7)
+    converted = planner.apply(df)
+
+    assert isinstance(converted['country_code'].dtype, pd.CategoricalDtype)
+    assert repr(planner.sql_types(planner.plan(converted))) == repr(planner.sql_types(planner.plan(df)))
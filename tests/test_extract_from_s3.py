@@ -0,0 +1,132 @@
+from data_cache import DataCache
+from data_extraction import DataExtractor
+from moto import mock_aws
+import boto3
+import time
+import pandas as pd
+import pytest
+
+
+BUCKET = 'data-handling-public'
+
+PRODUCTS = {
+    'products.csv': pd.DataFrame({'product_name': ['Apple', 'Pear'], 'weight': ['100g', '1kg']}),
+    'products/2022/january.csv': pd.DataFrame({'product_name': ['Plum'], 'weight': ['50g']}),
+    'products/2022/february.csv': pd.DataFrame({'product_name': ['Kiwi', 'Lime'], 'weight': ['75g', '2 x 30g']}),
+    'products/2022/notes.txt': None,
+    'products/2023/january.csv': pd.DataFrame({'product_name': ['Fig'], 'weight': ['40g']}),
+}
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        for key, df in PRODUCTS.items():
+            body = b'not a table' if df is None else df.to_csv().encode()
+            client.put_object(Bucket=BUCKET, Key=key, Body=body)
+        client.put_object(Bucket=BUCKET, Key='date_details.json',
+                          Body=b'{"timestamp": {"0": "22:00:06", "1": "09:15:44"}, "month": {"0": "9", "1": "2"}}')
+        yield client
+
+
+def expected(*keys) -> pd.DataFrame:
+    return pd.concat([PRODUCTS[key] for key in keys])
+
+
+def test_single_key(s3):
+    df = DataExtractor().extract_from_s3(f's3://{BUCKET}/products.csv')
+    pd.testing.assert_frame_equal(df, expected('products.csv'))
+
+
+def test_single_json_key(s3):
+    df = DataExtractor().extract_from_s3(f's3://{BUCKET}/date_details.json')
+    assert df['month'].tolist() == [9, 2]
+
+
+def test_nested_key(s3):
+    df = DataExtractor().extract_from_s3(f's3://{BUCKET}/products/2022/january.csv')
+    pd.testing.assert_frame_equal(df, expected('products/2022/january.csv'))
+
+
+def test_prefix(s3):
+    df = DataExtractor().extract_from_s3(f's3://{BUCKET}/products/2023/')
+    pd.testing.assert_frame_equal(df, expected('products/2023/january.csv'))
+
+
+def test_glob(s3):
+    df = DataExtractor().extract_from_s3(f's3://{BUCKET}/products/*/*.csv')
+    # objects are read in the order of their keys, the txt object does not match
+    pd.testing.assert_frame_equal(df, expected('products/2022/february.csv', 'products/2022/january.csv',
+                                               'products/2023/january.csv'))
+
+
+def test_iterate(s3):
+    dfs = DataExtractor().extract_from_s3(f's3://{BUCKET}/products/2022/*.csv', iterate=True)
+    assert not isinstance(dfs, pd.DataFrame)
+    dfs = list(dfs)
+    assert len(dfs) == 2
+    pd.testing.assert_frame_equal(dfs[0], expected('products/2022/february.csv'))
+    pd.testing.assert_frame_equal(dfs[1], expected('products/2022/january.csv'))
+
+
+def test_etag_cache_hits(s3, tmp_path):
+    cache = DataCache(str(tmp_path))
+    address = f's3://{BUCKET}/products/2022/*.csv'
+
+    first = DataExtractor(cache=cache).extract_from_s3(address)
+    assert cache.stats['misses'] == 2 and cache.stats['hits'] == 0
+
+    # unchanged objects are read from the cache by a new extractor
+    second = DataExtractor(cache=cache).extract_from_s3(address)
+    assert cache.stats['misses'] == 2 and cache.stats['hits'] == 2
+    pd.testing.assert_frame_equal(second, first)
+
+    # a changed object has a new ETag and is downloaded again
+    changed = pd.DataFrame({'product_name': ['Date'], 'weight': ['20g']})
+    s3.put_object(Bucket=BUCKET, Key='products/2022/january.csv', Body=changed.to_csv().encode())
+    third = DataExtractor(cache=cache).extract_from_s3(address)
+    assert cache.stats['misses'] == 3 and cache.stats['hits'] == 3
+    pd.testing.assert_frame_equal(third, pd.concat([PRODUCTS['products/2022/february.csv'], changed]))
+
+
+def test_single_key_etag_cache_hit(s3, tmp_path):
+    cache = DataCache(str(tmp_path))
+    address = f's3://{BUCKET}/products.csv'
+
+    DataExtractor(cache=cache).extract_from_s3(address)
+    df = DataExtractor(cache=cache).extract_from_s3(address)
+    assert cache.stats == {'hits': 1, 'misses': 1, 'evictions': 0}
+    pd.testing.assert_frame_equal(df, expected('products.csv'))
+
+
+@pytest.mark.parametrize('key_pattern', ['products/2024/', 'products/*.json', 'missing*'])
+def test_empty_match(s3, key_pattern):
+    with pytest.raises(ValueError, match='No objects found'):
+        DataExtractor().extract_from_s3(f's3://{BUCKET}/{key_pattern}')
+
+
+def test_iterate_downloads_at_most_max_workers_objects_ahead(s3):
+    for number in range(6):
+        s3.put_object(Bucket=BUCKET, Key=f'orders/part-{number}.csv', Body=PRODUCTS['products.csv'].to_csv().encode())
+    data_extractor = DataExtractor()
+    downloaded = []
+    read_s3_object = data_extractor.read_s3_object
+
+    def counting_read_s3_object(bucket, key):
+        downloaded.append(key)
+        return read_s3_object(bucket, key)
+    data_extractor.read_s3_object = counting_read_s3_object
+
+    dfs = data_extractor.extract_from_s3(f's3://{BUCKET}/orders/', max_workers=2, iterate=True)
+    next(dfs)
+    time.sleep(0.2)
+    # the first dataframe has been taken, only the next object is downloaded ahead
+    assert len(downloaded) == 2
+
+    assert len(list(dfs)) == 5
+    assert len(downloaded) == 6
@@ -0,0 +1,66 @@
+from data_extraction import DataExtractor
+from instrumentation import profiler
+from sqlalchemy import create_engine, text
+import pandas as pd
+import pytest
+
+
+class SQLiteConnector:
+    """
+    Stands in for DatabaseConnector with an in-memory SQLite database.
+    """
+    def __init__(self, df: pd.DataFrame, table_name: str) -> None:
+        self.engine = create_engine('sqlite://')
+        df.to_sql(table_name, self.engine, index=False)
+        self.table_name = table_name
+
+    def list_db_tables(self) -> list:
+        return [self.table_name]
+
+    def init_db_engine(self):
+        return self.engine
+
+
+@pytest.fixture
+def enabled_profiler(monkeypatch):
+    monkeypatch.setattr(profiler, 'enabled', True)
+    monkeypatch.setattr(profiler, 'steps', {})
+    return profiler
+
+
+def test_streamed_read_is_recorded_when_consumed(enabled_profiler):
+    connector = SQLiteConnector(pd.DataFrame({'index': range(10), 'value': list('abcdefghij')}), 'orders_table')
+    chunks = DataExtractor().stream_rds_table(connector, 'orders_table', chunk_size=3)
+    assert 'DataExtractor.stream_rds_table' not in enabled_profiler.steps
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    step = enabled_profiler.steps['DataExtractor.stream_rds_table']
+    assert step['calls'] == 1
+    assert step['rows_out'] == 10
+    assert step['frame_bytes_out'] > 0
+
+
+def test_partly_consumed_read_is_recorded_when_closed(enabled_profiler):
+    connector = SQLiteConnector(pd.DataFrame({'index': range(10)}), 'orders_table')
+    chunks = DataExtractor().stream_rds_table(connector, 'orders_table', chunk_size=4)
+    next(chunks)
+    chunks.close()
+
+    assert enabled_profiler.steps['DataExtractor.stream_rds_table']['rows_out'] == 4
+
+
+def test_chunked_json_read_is_recorded(enabled_profiler, tmp_path):
+    path = tmp_path / 'date_details.json'
+    pd.DataFrame({'month': range(1, 6)}).to_json(path, orient='records', lines=True)
+
+    chunks = list(DataExtractor().retrieve_json_data(str(path), chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert enabled_profiler.steps['DataExtractor.retrieve_json_data']['rows_out'] == 5
+
+
+def test_query_results_are_returned_unchanged(enabled_profiler):
+    connector = SQLiteConnector(pd.DataFrame({'b': [1, 2], 'a': ['x', 'y']}), 'legacy_users')
+    df = DataExtractor().read_rds_table(connector, 'legacy_users')
+
+    assert list(df.columns) == ['b', 'a']
+    assert enabled_profiler.steps['DataExtractor.read_rds_table']['rows_out'] == 2
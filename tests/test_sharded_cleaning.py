@@ -0,0 +1,37 @@
+from data_cleaning import DataCleaning
+from sharded_cleaning import ShardedCleaner, drop_duplicates
+from synthetic_data import SyntheticDataGenerator
+import pandas as pd
+import pytest
+
+
+def user_data_with_duplicates() -> pd.DataFrame:
+    df = SyntheticDataGenerator(seed=0, error_rate=0.05).user_data(3000)
+    duplicates = df.sample(100, random_state=0).assign(first_name='Duplicate')
+    return pd.concat([df, duplicates], ignore_index=True)
+
+
+@pytest.mark.parametrize('min_partition_rows', [1000, 50000])
+def test_clean_with_reduce_matches_serial_cleaning(min_partition_rows):
+    df = user_data_with_duplicates()
+    expected = DataCleaning().clean_user_data(df.copy()).drop_duplicates(subset=['user_uuid'], keep='first')
+
+    data_cleaning = DataCleaning()
+    sharded_cleaner = ShardedCleaner(data_cleaning, max_workers=2, min_partition_rows=min_partition_rows)
+    result = sharded_cleaner.clean(df.copy(), 'clean_user_data', reduce=drop_duplicates(['user_uuid'], reject_key='user_uuid'))
+
+    pd.testing.assert_frame_equal(result, expected)
+    # the rows rejected during cleaning and the removed duplicates are kept for the quarantine
+    rejected = data_cleaning.rejected_rows['user_uuid']
+    assert len(result) + len(rejected) == len(df)
+    assert (rejected['first_name'] == 'Duplicate').sum() == (df['first_name'] == 'Duplicate').sum()
+    assert not (result['first_name'] == 'Duplicate').any()
+
+
+def test_drop_duplicates_without_reject_key_keeps_rejected_rows_unchanged():
+    df = pd.DataFrame({'user_uuid': ['a', 'b', 'a'], 'value': [1, 2, 3]})
+    rejected_rows = {}
+    result = drop_duplicates(['user_uuid'])(df, rejected_rows)
+
+    assert result['value'].tolist() == [1, 2]
+    assert rejected_rows == {}
@@ -0,0 +1,101 @@
+from data_extraction import DataExtractor
+from stores_crawler import CrawlCheckpoint, StoresCrawler
+from synthetic_data import StoresApiStub, SyntheticDataGenerator
+import time
+import pandas as pd
+import pytest
+import requests
+
+
+NUMBER_OF_STORES = 20
+
+
+@pytest.fixture
+def df_stores() -> pd.DataFrame:
+    return SyntheticDataGenerator(seed=0).store_data(NUMBER_OF_STORES)
+
+
+def counting_fetch_store(session, endpoint: str, fetched: list):
+    """
+    Returns a fetch_store function for StoresCrawler.crawl, recording the numbers of the fetched stores.
+    """
+    def fetch_store(store_number: int) -> dict:
+        fetched.append(store_number)
+        return DataExtractor().retrieve_store_details(session, endpoint, store_number)
+    return fetch_store
+
+
+def assert_stores_equal(df: pd.DataFrame, df_stores: pd.DataFrame) -> None:
+    expected = pd.read_json(df_stores.to_json(orient='records'), orient='records')
+    pd.testing.assert_frame_equal(pd.read_json(df.to_json(orient='records'), orient='records'), expected)
+
+
+def test_crawl_resumes_after_failure(df_stores):
+    checkpoint = CrawlCheckpoint()
+    crawler = StoresCrawler(checkpoint, max_workers=4)
+    with StoresApiStub(df_stores, latency=0, failure_rate=0.3) as api:
+        endpoint = f'{api.url}/store_details/'
+
+        # without retries the first failed request stops the crawl
+        with DataExtractor().create_api_session({}, retries=0) as session, pytest.raises(requests.RequestException):
+            crawler.crawl(endpoint, NUMBER_OF_STORES, counting_fetch_store(session, endpoint, []))
+        restored = checkpoint.fresh_stores(endpoint, NUMBER_OF_STORES)
+        assert 0 < len(restored) < NUMBER_OF_STORES
+
+        fetched = []
+        with DataExtractor().create_api_session({}, retries=10, backoff_factor=0) as session:
+            df = crawler.crawl(endpoint, NUMBER_OF_STORES, counting_fetch_store(session, endpoint, fetched))
+
+    # only the stores missing from the checkpoint are fetched again
+    assert sorted(fetched) == sorted(set(range(NUMBER_OF_STORES)) - set(restored))
+    assert_stores_equal(df, df_stores)
+
+
+def test_crawl_fetches_new_and_stale_stores(df_stores):
+    checkpoint = CrawlCheckpoint()
+    crawler = StoresCrawler(checkpoint, max_workers=4)
+    with StoresApiStub(df_stores, latency=0) as api, DataExtractor().create_api_session({}) as session:
+        endpoint = f'{api.url}/store_details/'
+        crawler.crawl(endpoint, NUMBER_OF_STORES - 5, counting_fetch_store(session, endpoint, []))
+
+        # stores added since the last crawl are fetched, the others are restored from the checkpoint
+        fetched = []
+        df = crawler.crawl(endpoint, NUMBER_OF_STORES, counting_fetch_store(session, endpoint, fetched))
+        assert sorted(fetched) == list(range(NUMBER_OF_STORES - 5, NUMBER_OF_STORES))
+        assert_stores_equal(df, df_stores)
+
+        # stale stores are fetched again
+        checkpoint.max_age = 0
+        fetched = []
+        crawler.crawl(endpoint, NUMBER_OF_STORES, counting_fetch_store(session, endpoint, fetched))
+        assert sorted(fetched) == list(range(NUMBER_OF_STORES))
+
+
+def test_retrieve_stores_data_resumes_from_checkpoint(df_stores):
+    checkpoint = CrawlCheckpoint()
+    with StoresApiStub(df_stores, latency=0) as api:
+        endpoint = f'{api.url}/store_details/'
+        DataExtractor(stores_checkpoint=checkpoint).retrieve_stores_data(endpoint, NUMBER_OF_STORES, {})
+        number_of_requests = len(api.request_times)
+
+        df = DataExtractor(stores_checkpoint=checkpoint).retrieve_stores_data(endpoint, NUMBER_OF_STORES, {})
+
+    assert number_of_requests == NUMBER_OF_STORES
+    assert len(api.request_times) == NUMBER_OF_STORES
+    assert_stores_equal(df, df_stores)
+
+
+def test_retries_take_tokens_from_the_rate_limiter(df_stores):
+    requests_per_second = 20
+    crawler = StoresCrawler(CrawlCheckpoint(), requests_per_second=requests_per_second, max_workers=8)
+    with StoresApiStub(df_stores, latency=0, failure_rate=0.3) as api:
+        endpoint = f'{api.url}/store_details/'
+        start = time.monotonic()
+        with DataExtractor().create_api_session({}, retries=10, backoff_factor=0, rate_limiter=crawler.rate_limiter) as session:
+            crawler.crawl(endpoint, NUMBER_OF_STORES, counting_fetch_store(session, endpoint, []))
+
+    # the failed requests were retried, and no more requests were sent than the full bucket and the refill allow
+    assert len(api.request_times) > NUMBER_OF_STORES
+    for number_of_requests, request_time in enumerate(sorted(api.request_times), start=1):
+        allowed = crawler.rate_limiter.capacity + (request_time - start) * requests_per_second
+        assert number_of_requests <= allowed + 1
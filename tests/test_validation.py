@@ -0,0 +1,24 @@
+from database_utils import DatabaseConnector
+from sqlalchemy import create_engine, text
+from validation import DataValidator
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def database_conn(tmp_path, monkeypatch):
+    creds = tmp_path / 'db_creds.yaml'
+    creds.write_text('RDS_HOST: localhost\nRDS_USER: user\nRDS_PASSWORD: password\nRDS_DATABASE: sales_data\nRDS_PORT: 5432\n')
+    database_conn = DatabaseConnector(str(creds))
+    engine = create_engine('sqlite://')
+    monkeypatch.setattr(database_conn, 'init_db_engine', lambda: engine)
+    return database_conn
+
+
+def test_dropping_the_quarantine_table_invalidates_the_table_cache(database_conn):
+    with database_conn.init_db_engine().begin() as conn:
+        conn.execute(text('CREATE TABLE "quarantine_orders_table" (reason TEXT)'))
+    assert database_conn.list_db_tables() == ['quarantine_orders_table']
+
+    DataValidator(database_conn).quarantine(pd.DataFrame({'reason': []}), 'orders_table')
+    assert database_conn.list_db_tables() == []
@@ -0,0 +1,175 @@
+from database_utils import DatabaseConnector
+from dtype_planner import DtypePlanner
+from instrumentation import instrumented
+from sqlalchemy import text
+import numpy as np
+import pandas as pd
+
+
+def matches(pattern: str):
+    """
+    Constraint passed by entries fully matching a regular expression.
+    """
+    return lambda series: series.astype('string').str.match(pattern, na=False).astype(bool)
+
+
+def passes_luhn():
+    """
+    Constraint passed by card numbers of up to 19 digits with a valid Luhn check digit. The digits of all card numbers
+    are checked at once as a two dimensional array, card numbers are padded with leading zeros, which do not change the sum.
+    """
+    def constraint(series: pd.Series) -> pd.Series:
+        numbers = series.astype('string')
+        digits_only = numbers.str.fullmatch(r'\d{1,19}', na=False).astype(bool)
+        padded = numbers[digits_only].str.zfill(19)
+        digits = (np.frombuffer(''.join(padded).encode(), dtype=np.uint8).reshape(-1, 19) - ord('0')).astype(np.int64)
+        # every second digit from the right is doubled, the digits of the doubled values are added
+        digits[:, -2::-2] *= 2
+        digits[digits > 9] -= 9
+        valid = np.zeros(len(series), dtype=bool)
+        valid[digits_only.to_numpy()] = digits.sum(axis=1) % 10 == 0
+        return pd.Series(valid, index=series.index)
+    return constraint
+
+
+def in_range(low: float = None, high: float = None):
+    """
+    Constraint passed by entries greater than low and lower than high, missing entries fail.
+    """
+    def constraint(series: pd.Series) -> pd.Series:
+        valid = series.notna()
+        if low is not None:
+            valid &= series > low
+        if high is not None:
+            valid &= series < high
+        return valid.astype(bool)
+    return constraint
+
+
+@instrumented
+class DataValidator:
+    """
+    Validates cleaned tables against declared constraints and moves the failing rows to quarantine tables in the local
+    database, so that a load that shrinks can be explained without running it again. Each quarantine table
+    (quarantine_<table_name>) holds the failing rows as text together with a reason code and the time of the load.
+
+    Every constraint is evaluated on a whole column at once. Rows removed during cleaning (the rejected_rows of DataCleaning)
+    are quarantined together with the rows failing validation, with the reason code 'incorrect_<column>'.
+
+        Args:
+            db_connector_instance (DatabaseConnector): connector for the local database, holding the dimension tables
+                referenced by the foreign keys and the quarantine tables
+    """
+    # weights in kg have to be positive, there is no upper bound since the 'Truck_Required' weight_class of Task 4 is open ended
+    # (140 kg and more), so only missing, zero and negative weights fail
+    WEIGHT_RANGE = (0, None)
+
+    CONSTRAINTS = {
+        'dim_user_details': {'user_uuid': [('invalid_uuid', matches(DtypePlanner.UUID_PATTERN))]},
+        'dim_card_details': {'card_number': [('failed_luhn_check', passes_luhn())]},
+        'dim_products': {
+            'uuid': [('invalid_uuid', matches(DtypePlanner.UUID_PATTERN))],
+            'weight': [('non_positive_weight', in_range(*WEIGHT_RANGE))],
+        },
+        'dim_date_times': {'date_uuid': [('invalid_uuid', matches(DtypePlanner.UUID_PATTERN))]},
+        'orders_table': {
+            'date_uuid': [('invalid_uuid', matches(DtypePlanner.UUID_PATTERN))],
+            'user_uuid': [('invalid_uuid', matches(DtypePlanner.UUID_PATTERN))],
+        },
+    }
+
+    # columns referencing the primary keys of the dimension tables, keyed by table name
+    FOREIGN_KEYS = {
+        'orders_table': {
+            'date_uuid': ('dim_date_times', 'date_uuid'),
+            'user_uuid': ('dim_user_details', 'user_uuid'),
+            'card_number': ('dim_card_details', 'card_number'),
+            'store_code': ('dim_store_details', 'store_code'),
+            'product_code': ('dim_products', 'product_code'),
+        },
+    }
+
+    # keys of the DataCleaning.rejected_rows dictionary holding the rows removed from each table during cleaning
+    REJECTED_ROWS_KEYS = {
+        'dim_user_details': ['user_uuid'],
+        'dim_card_details': ['card_number'],
+        'dim_store_details': ['country_code'],
+        'dim_products': ['weight'],
+        'dim_date_times': ['timestamp'],
+    }
+
+    def __init__(self, db_connector_instance: DatabaseConnector) -> None:
+        self.db_connector = db_connector_instance
+        self._reference_keys = {}
+
+    def validate(self, df: pd.DataFrame, table_name: str, rejected_rows: dict = None, if_exists: str = 'replace') -> pd.DataFrame:
+        """
+        Checks the cleaned rows of a table against its constraints and foreign keys, writes the failing rows and the rows
+        rejected during cleaning to the quarantine table and returns the valid rows.
+
+        Args:
+            df (pd.DataFrame): cleaned dataframe
+            table_name (str): name of the table in the local database
+            rejected_rows (dict): rejected rows of DataCleaning, the entries of this table are removed from it
+            if_exists (str): 'replace' starts a new quarantine table, 'append' adds to it (for tables loaded in chunks)
+        Returns:
+            df (pd.DataFrame): the rows passing validation
+        """
+        reasons = pd.Series('', index=df.index)
+        for column, constraints in self.CONSTRAINTS.get(table_name, {}).items():
+            for reason, constraint in constraints:
+                reasons = reasons.mask(~constraint(df[column]), reasons + f'{reason}:{column};')
+        for column, (reference_table, reference_column) in self.FOREIGN_KEYS.get(table_name, {}).items():
+            keys = self.reference_keys(reference_table, reference_column)
+            reasons = reasons.mask(~df[column].astype(str).isin(keys), reasons + f'missing_in_{reference_table};')
+
+        failed_mask = (reasons != '').to_numpy()
+        quarantine = [df[failed_mask].assign(reason=reasons[failed_mask].str.rstrip(';'))]
+        for key in self.REJECTED_ROWS_KEYS.get(table_name, []):
+            df_rejected = (rejected_rows or {}).pop(key, None)
+            if df_rejected is not None and len(df_rejected) > 0:
+                quarantine.append(df_rejected.assign(reason=f'incorrect_{key}'))
+
+        self.quarantine(pd.concat(quarantine), table_name, if_exists)
+        return df[~failed_mask]
+
+    def reference_keys(self, table_name: str, column: str) -> pd.Index:
+        """
+        Reads the distinct values of a primary key column from the local database, as text. The keys are read once
+        per validator, so that orders_table can be validated in chunks.
+
+        Args:
+            table_name (str): name of the referenced dimension table
+            column (str): name of the primary key column
+        Returns:
+            pd.Index: the distinct keys
+        """
+        if (table_name, column) not in self._reference_keys:
+            engine = self.db_connector.init_db_engine()
+            with engine.connect() as conn:
+                keys = conn.execute(text(f'SELECT DISTINCT "{column}"::text FROM "{table_name}"')).scalars().all()
+            self._reference_keys[(table_name, column)] = pd.Index(keys)
+        return self._reference_keys[(table_name, column)]
+
+    def quarantine(self, df: pd.DataFrame, table_name: str, if_exists: str = 'replace') -> None:
+        """
+        Bulk writes rows to the quarantine table of a table. All columns are stored as text, since the rejected rows
+        contain the incorrect entries of the raw data. The cached list of tables of the connector is invalidated whenever
+        the quarantine table is dropped or created.
+
+        Args:
+            df (pd.DataFrame): rows to quarantine, with a 'reason' column
+            table_name (str): name of the validated table
+            if_exists (str): 'replace' or 'append'
+        """
+        quarantine_table_name = f'quarantine_{table_name}'
+        if len(df) == 0:
+            if if_exists != 'append':
+                with self.db_connector.init_db_engine().begin() as conn:
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{quarantine_table_name}"'))
+                self.db_connector.invalidate_table_cache()
+            return
+        df = df.astype(object).astype('string')
+        df['quarantined_at'] = pd.Timestamp.now(tz='UTC')
+        self.db_connector.upload_to_db(df, quarantine_table_name, if_exists=if_exists, plan_dtypes=False)
+        print(f'{len(df)} rows of {table_name} have been quarantined.')